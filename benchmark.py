@@ -0,0 +1,280 @@
+"""Benchmarks for BlitzDex's hot paths, plus a generator for large synthetic deployments.
+
+    python benchmark.py generate --out bench-data [--users 10000] [--guilds 200] [--days 30] [--seed 1]
+    python benchmark.py run --data bench-data [--iterations 5000] [--threshold 0.25] [--fail-on-regression]
+
+`generate` writes inventories, claim, steal and spawn logs and server configs in the bot's CSV format, using the
+real card catalog. `run` imports bot.py against that data without connecting to Discord, times each hot path and
+appends the results to <data>/benchmark_history.jsonl; each run is compared with the last run on the same dataset.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+DATASET_FILE = "benchmark_dataset.json"
+HISTORY_FILE = "benchmark_history.jsonl"
+NOISE_FLOOR_US = 0.5 # Median changes smaller than this are never reported as regressions
+
+
+def import_bot(data_dir: str):
+    """bot.py reads DATA_DIR at import, so it has to be set first."""
+    os.environ['DATA_DIR'] = os.path.abspath(data_dir)
+    sys.path.insert(0, SCRIPT_DIR)
+    import bot
+    return bot
+
+
+# --- Dataset generation ---
+def generate(args):
+    os.makedirs(args.out, exist_ok=True)
+    bot = import_bot(args.out)
+    existing = [p for p in (bot.INVENTORY_CSV_FILE, bot.STEAL_LOG_CSV_FILE, bot.LOGS_PATH, bot.CONFIG_FILE) if os.path.exists(p)]
+    if existing and not args.force: sys.exit(f"{args.out} already has bot data ({', '.join(map(os.path.basename, existing))}); pass --force to overwrite.")
+    cards = bot.compile_card_catalog(1).cards
+    if not cards: sys.exit("No cards in the catalog; the dataset needs real card names.")
+    rng = random.Random(args.seed)
+    card_names, card_weights = [card.main_name for card in cards], [card.weight for card in cards]
+
+    # A few heavy collectors and a long tail, as on a real deployment.
+    user_ids = rng.sample(range(10**17, 10**18), args.users)
+    activity = {user_id: rng.paretovariate(1.2) for user_id in user_ids}
+    guild_ids = rng.sample(range(10**17, 10**18), args.guilds)
+    members = {guild_id: [] for guild_id in guild_ids}
+    for user_id in user_ids:
+        for guild_id in rng.sample(guild_ids, min(len(guild_ids), rng.choice((1, 1, 1, 2, 3)))): members[guild_id].append(user_id)
+    member_weights = {guild_id: [activity[user_id] for user_id in users] for guild_id, users in members.items()}
+
+    now = datetime.now(timezone.utc)
+    start = (now - timedelta(days=args.days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    inventory, spawn_rows, claim_rows, owner_rows = {}, [], [], []
+    for day in range(args.days):
+        day_start = start + timedelta(days=day)
+        for guild_id in guild_ids:
+            spawns = rng.randint(args.spawns_per_day // 2, args.spawns_per_day)
+            for offset in sorted(rng.uniform(0, 86400) for _ in range(spawns)):
+                when = day_start + timedelta(seconds=offset)
+                if when > now: break
+                name = rng.choices(card_names, card_weights)[0]
+                spawn_rows.append((when.isoformat(), guild_id, name))
+                if not members[guild_id] or rng.random() >= args.claim_rate: continue
+                user_id = rng.choices(members[guild_id], member_weights[guild_id])[0]
+                unique_id = f"{name}-{when.timestamp()}-{rng.randint(1000, 9999)}"
+                claim_rows.append(((when + timedelta(seconds=rng.uniform(5, 90))).isoformat(), user_id, f"user{user_id % 100000}", name, guild_id))
+                owner_rows.append((unique_id, user_id))
+                inventory[unique_id] = [user_id, name, False]
+
+    # Steals and gives move cards after the fact; stolen cards keep their original owner in the steal log.
+    unique_ids = list(inventory)
+    for unique_id in rng.sample(unique_ids, int(len(unique_ids) * args.transfer_rate)):
+        card = inventory[unique_id]; card[0] = rng.choice(user_ids); card[2] = rng.random() < 0.5
+
+    def write_csv(path, header, rows):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f); writer.writerow(header); writer.writerows(rows)
+
+    write_csv(bot.INVENTORY_CSV_FILE, bot.INVENTORY_HEADER, ((user_id, f"user{user_id % 100000}", name, 'True' if stolen else '', unique_id) for unique_id, (user_id, name, stolen) in inventory.items()))
+    write_csv(bot.STEAL_LOG_CSV_FILE, ["unique_id", "original_owner_id"], owner_rows)
+    for path in (bot.INVENTORY_JOURNAL_FILE, bot.INVENTORY_JOURNAL_FILE + ".compacting", bot.CONFIG_JOURNAL_FILE, bot.CLAIMS_CSV_FILE, bot.SPAWN_HISTORY_CSV_FILE):
+        if os.path.exists(path): os.remove(path)
+    shutil.rmtree(bot.LOGS_PATH, ignore_errors=True)
+    storage = bot.CsvStorage(); storage.setup() # Written through the bot's own log writer, as daily segments
+    storage.log_claims(claim_rows); storage.log_spawns(spawn_rows); storage.archive_logs()
+    configs = {str(guild_id): {"is_approved": True, "spawn_channel_id": rng.randrange(10**17, 10**18),
+                               "next_spawn_time": (now + timedelta(minutes=rng.uniform(bot.MIN_SPAWN_INTERVAL, bot.MAX_SPAWN_INTERVAL))).isoformat()}
+               for guild_id in guild_ids}
+    with open(bot.CONFIG_FILE, 'w') as f: json.dump(configs, f)
+    with open(os.path.join(args.out, DATASET_FILE), 'w') as f:
+        json.dump({"users": args.users, "guilds": args.guilds, "days": args.days, "spawns_per_day": args.spawns_per_day,
+                   "claim_rate": args.claim_rate, "transfer_rate": args.transfer_rate, "seed": args.seed, "generated_at": now.isoformat()}, f, indent=2)
+    print(f"Wrote {len(spawn_rows)} spawns, {len(claim_rows)} claims and {len(inventory)} inventory cards for "
+          f"{args.users} users in {args.guilds} guilds over {args.days} days to {args.out}.")
+
+
+# --- Benchmarks ---
+def measure(fn, iterations: int, setup=None) -> list:
+    """Per-call timings in microseconds. `setup`, if given, runs untimed before each call and its result is passed in."""
+    samples, clock = [], time.perf_counter_ns
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        start = clock(); fn(arg); samples.append((clock() - start) / 1000)
+    return samples
+
+
+async def measure_async(fn, iterations: int, setup) -> list:
+    samples, clock = [], time.perf_counter_ns
+    for _ in range(iterations):
+        arg = setup()
+        start = clock(); await fn(arg); samples.append((clock() - start) / 1000)
+    return samples
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"n": len(samples), "mean_us": statistics.fmean(samples), "median_us": statistics.median(samples), "p95_us": pick(0.95), "p99_us": pick(0.99)}
+
+
+class FakeInteraction:
+    """Just enough of discord.Interaction for the autocomplete handlers."""
+    class _User:
+        def __init__(self, user_id): self.id = user_id
+    class _Namespace:
+        def __init__(self, victim): self.victim = victim
+    def __init__(self, user_id, victim_id=None):
+        self.user = self._User(user_id)
+        self.namespace = self._Namespace(self._User(victim_id) if victim_id else None)
+
+
+def run_benchmarks(bot, iterations: int, rng: random.Random) -> dict:
+    results = {}
+    store = bot.INVENTORY_STORE
+    user_ids = list(store.by_user)
+    whale = max(user_ids, key=lambda user_id: len(store.by_user[user_id]))
+    unique_ids = list(store.by_unique_id)
+    guild_ids = [int(guild_id) for guild_id in bot.SERVER_CONFIGS]
+    card_names = [card.main_name for card in bot.ALL_CARDS]
+    queries = [""] + [name[:n].lower() for name in card_names for n in (1, 2, 3)] + [name[1:4].lower() for name in card_names]
+
+    async def inventory_calls():
+        timings = {}
+        timings["get_user_inventory"] = await measure_async(bot.get_user_inventory, iterations, lambda: rng.choice(user_ids))
+        timings["get_user_inventory[whale]"] = await measure_async(bot.get_user_inventory, iterations, lambda: whale)
+
+        removed = []
+        def restore():
+            while removed:
+                card = removed.pop()
+                store.add(int(card['user_id']), card['username'], card['card_name'], card['is_stolen'] == 'True', card['unique_id'])
+        def pick_card():
+            restore() # put the previous iteration's card back, untimed
+            user_id = rng.choice(user_ids)
+            return user_id, rng.choice(store.by_user[user_id])['name']
+        async def remove(arg): removed.append(await bot.remove_card_from_inventory(*arg))
+        timings["remove_card_from_inventory"] = await measure_async(remove, iterations, pick_card)
+        restore()
+        store.pending_ops.clear() # never written back; the dataset stays untouched
+
+        timings["get_original_owner"] = await measure_async(bot.get_original_owner, iterations, lambda: rng.choice(unique_ids))
+        return timings
+    results.update(asyncio.run(inventory_calls()))
+    results["get_daily_spawn_counts"] = measure(bot.get_daily_spawn_counts, iterations, lambda: rng.choice(guild_ids))
+
+    bot.LEADERBOARDS.load_claims(bot.STORAGE.claim_totals())
+    boards = list(bot.LEADERBOARD_BOARDS)
+    results["leaderboard[server]"] = measure(lambda arg: bot.LEADERBOARDS.top(*arg), iterations, lambda: (rng.choice(boards), rng.choice(guild_ids)))
+    results["leaderboard[global]"] = measure(bot.LEADERBOARDS.top, iterations, lambda: rng.choice(boards))
+    results["card_stats"] = measure(lambda name: bot.LEADERBOARDS.card_stats(name, rng.choice(guild_ids)), iterations, lambda: rng.choice(card_names))
+
+    def spawn(guild_id):
+        # do_spawn's in-memory work, without the Discord message or the log writes
+        card = bot.SPAWN_SAMPLER.choose(guild_id)
+        history = bot.RECENTLY_SPAWNED[guild_id]
+        evicted = history[0] if len(history) == history.maxlen else None
+        history.append(card.main_name)
+        bot.DAILY_SPAWN_COUNTS.record(guild_id, card.main_name, datetime.now(timezone.utc))
+        bot.SPAWN_SAMPLER.record_spawn(guild_id, card.main_name, evicted)
+    results["spawn_selection"] = measure(spawn, iterations, lambda: rng.choice(guild_ids))
+
+    async def autocomplete():
+        timings = {}
+        handlers = {"give_autocomplete": bot.give_autocomplete, "card_view_autocomplete": bot.card_view_autocomplete}
+        for name, handler in handlers.items():
+            timings[name] = await measure_async(lambda arg: handler(*arg), iterations, lambda: (FakeInteraction(rng.choice(user_ids)), rng.choice(queries)))
+        def cold():
+            user_id = rng.choice(user_ids); store._invalidate_names(user_id)
+            return FakeInteraction(user_id), rng.choice(queries)
+        timings["give_autocomplete[cold cache]"] = await measure_async(lambda arg: bot.give_autocomplete(*arg), iterations, cold)
+        timings["give_autocomplete[whale]"] = await measure_async(lambda arg: bot.give_autocomplete(*arg), iterations, lambda: (FakeInteraction(whale), rng.choice(queries)))
+        timings["steal_autocomplete"] = await measure_async(lambda arg: bot.steal_autocomplete(*arg), iterations, lambda: (FakeInteraction(0, rng.choice(user_ids)), rng.choice(queries)))
+        timings["specific_spawn_autocomplete"] = await measure_async(lambda arg: bot.specific_spawn_autocomplete(*arg), iterations, lambda: (FakeInteraction(0), rng.choice(queries)))
+        return timings
+    results.update(asyncio.run(autocomplete()))
+    return {name: summarize(samples) for name, samples in results.items()}
+
+
+def git_commit() -> str:
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+
+def previous_run(history_path: str, dataset: dict):
+    try:
+        with open(history_path, 'r', encoding='utf-8') as f: runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError: return None
+    return next((entry for entry in reversed(runs) if entry.get("dataset") == dataset), None)
+
+
+def run(args):
+    try:
+        with open(os.path.join(args.data, DATASET_FILE), 'r') as f: dataset = json.load(f)
+    except FileNotFoundError: sys.exit(f"No dataset in {args.data}; create one with `python benchmark.py generate --out {args.data}`.")
+    bot = import_bot(args.data)
+    if bot.INVENTORY_PERSISTENCE != 'journal' or bot.STORAGE_BACKEND != 'csv':
+        print("Note: benchmarking with a non-default storage configuration.")
+
+    start = time.perf_counter()
+    bot.load_data()
+    load_ms = (time.perf_counter() - start) * 1000
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w') # The hot paths print; keep terminal I/O out of the timings
+    try: results = run_benchmarks(bot, args.iterations, random.Random(args.seed))
+    finally: sys.stdout.close(); sys.stdout = stdout
+    bot.INVENTORY_STORE.pending_ops.clear()
+
+    history_path = os.path.join(args.data, HISTORY_FILE)
+    baseline = previous_run(history_path, dataset)
+    regressions = []
+    print(f"\nload_data: {load_ms:.1f} ms  ({len(bot.INVENTORY_STORE.by_unique_id)} cards, {len(bot.INVENTORY_STORE.by_user)} users)")
+    print(f"{'benchmark':<34}{'median':>10}{'p95':>10}{'p99':>10}{'vs last':>10}")
+    for name, stats in results.items():
+        change = ""
+        if baseline and name in baseline["results"]:
+            before = baseline["results"][name]["median_us"]
+            change = f"{(stats['median_us'] - before) / before * 100:+.0f}%" if before else ""
+            if stats["median_us"] > before * (1 + args.threshold) and stats["median_us"] - before > NOISE_FLOOR_US:
+                regressions.append(name); change += " !"
+        print(f"{name:<34}{stats['median_us']:>8.2f}us{stats['p95_us']:>8.2f}us{stats['p99_us']:>8.2f}us{change:>10}")
+
+    entry = {"timestamp": datetime.now(timezone.utc).isoformat(), "commit": git_commit(), "dataset": dataset,
+             "iterations": args.iterations, "load_data_ms": load_ms, "results": results}
+    with open(history_path, 'a', encoding='utf-8') as f: f.write(json.dumps(entry) + "\n")
+    if baseline: print(f"\nCompared with the run at {baseline['timestamp']} (commit {baseline.get('commit') or 'unknown'}).")
+    if regressions:
+        print(f"Regressions (median more than {args.threshold:.0%} slower): {', '.join(regressions)}")
+        if args.fail_on_regression: sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BlitzDex benchmarks and synthetic dataset generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    gen = commands.add_parser("generate", help="Write a synthetic dataset in the bot's data format.")
+    gen.add_argument("--out", required=True, help="Directory to write the dataset to (used as DATA_DIR)")
+    gen.add_argument("--users", type=int, default=10000)
+    gen.add_argument("--guilds", type=int, default=200)
+    gen.add_argument("--days", type=int, default=30)
+    gen.add_argument("--spawns-per-day", type=int, default=60, help="Upper bound on spawns per guild per day")
+    gen.add_argument("--claim-rate", type=float, default=0.7, help="Fraction of spawns that get claimed")
+    gen.add_argument("--transfer-rate", type=float, default=0.05, help="Fraction of cards later stolen or given away")
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--force", action="store_true", help="Overwrite existing data files in --out")
+    bench = commands.add_parser("run", help="Time the hot paths against a generated dataset.")
+    bench.add_argument("--data", required=True, help="Dataset directory created by `generate`")
+    bench.add_argument("--iterations", type=int, default=5000)
+    bench.add_argument("--seed", type=int, default=1)
+    bench.add_argument("--threshold", type=float, default=0.25, help="Relative median slowdown reported as a regression")
+    bench.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any benchmark regressed")
+    args = parser.parse_args()
+    generate(args) if args.command == "generate" else run(args)
+
+
+if __name__ == "__main__":
+    main()
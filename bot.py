@@ -6,12 +6,35 @@ from dotenv import load_dotenv
 import random
 import csv
 import json
-from datetime import datetime, timezone, timedelta
-from collections import defaultdict, deque
+from datetime import datetime, date, timezone, timedelta
+from collections import defaultdict, deque, Counter
 import asyncio
 from typing import Union
 import traceback
 import shutil
+import gzip
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+import bisect
+import itertools
+import heapq
+import time
+import hashlib
+import io
+from collections import OrderedDict
+from types import MappingProxyType, SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+import aiohttp
+from aiohttp import web
+import functools
+import socket
+import signal
+import argparse
+import subprocess
 
 # --- 1. CONFIGURATION & SETUP ---
 load_dotenv()
@@ -22,17 +45,30 @@ DATA_DIR = os.environ.get('DATA_DIR', os.path.dirname(os.path.realpath(__file__)
 print(f"Using data directory: {DATA_DIR}")
 
 # --- File Paths ---
-CLAIMS_CSV_FILE = os.path.join(DATA_DIR, "card_claims.csv")
+CLAIMS_CSV_FILE = os.path.join(DATA_DIR, "card_claims.csv") # Pre-segmentation log; split into LOGS_PATH on startup
 INVENTORY_CSV_FILE = os.path.join(DATA_DIR, "user_inventories.csv")
+INVENTORY_JOURNAL_FILE = os.path.join(DATA_DIR, "user_inventories.journal")
 CONFIG_FILE = os.path.join(DATA_DIR, "server_configs.json")
-SPAWN_HISTORY_CSV_FILE = os.path.join(DATA_DIR, "spawn_history.csv")
+CONFIG_JOURNAL_FILE = os.path.join(DATA_DIR, "server_configs.journal") # One JSON line of changed configs per save, replayed over CONFIG_FILE
+SPAWN_HISTORY_CSV_FILE = os.path.join(DATA_DIR, "spawn_history.csv") # Pre-segmentation log; split into LOGS_PATH on startup
+LOGS_PATH = os.path.join(DATA_DIR, "logs") # Claim and spawn logs, one CSV segment per UTC day; old days are gzipped
+SPAWN_TAILS_PATH = os.path.join(LOGS_PATH, "spawn_tails") # <guild_id>.json: each server's last few spawns, so startup never reads the logs
+SPAWN_TAILS_FILE = os.path.join(LOGS_PATH, "spawn_tails.json") # Every server's tail in one file; split into SPAWN_TAILS_PATH on startup
+CLAIM_TOTALS_FILE = os.path.join(LOGS_PATH, "claim_totals.json") # Claim counts of every archived day, so startup only reads recent ones
 STEAL_LOG_CSV_FILE = os.path.join(DATA_DIR, "steal_log.csv")
+SQLITE_DB_FILE = os.path.join(DATA_DIR, "blitzdex.db")
+RATE_LIMITS_FILE = os.path.join(DATA_DIR, "rate_limits.json") # Snapshot of the long rate-limit windows (steals)
+COMMAND_TREE_HASH_FILE = os.path.join(DATA_DIR, "command_tree.sha256") # Hash of the last command tree synced to Discord
+CLUSTER_SOCKET_FILE = os.environ.get('CLUSTER_SOCKET', os.path.join(DATA_DIR, "cluster.sock")) # Coordinator <-> worker IPC in cluster mode
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'csv') # 'csv' or 'sqlite'
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 PREFIX_WEIGHTS_CSV_FILE = os.path.join(SCRIPT_DIR, "prefix_weights.csv")
 CARD_NAMES_CSV_FILE = os.path.join(SCRIPT_DIR, "card_names.csv")
 CARDS_PATH = os.path.join(SCRIPT_DIR, "cards")
 THUMBNAILS_PATH = os.path.join(SCRIPT_DIR, "thumbnails")
+ASSETS_PATH = os.path.join(SCRIPT_DIR, "assets") # Output of build_assets.py
+ASSET_MANIFEST_FILE = os.path.join(ASSETS_PATH, "manifest.json")
 
 # --- REBALANCED GAMEPLAY CONSTANTS ---
 RARITY_VALUES = {
@@ -40,6 +76,7 @@ RARITY_VALUES = {
     "CR": 80, "IT": 80, "D": 80, "OMN": 80, "P": 80, "RTX": 80
 }
 STEALABLE_RARITIES = ["R", "UR", "SR", "L", "K", "CR", "IT", "D", "OMN", "P", "RTX"]
+UNDERDOG_STEAL_CHANCES = {"R": 5.0, "UR": 15.0, "SR": 20.0} # Fixed odds when leveraging these against an L or rarer target
 MAX_RARITY_VALUE_DIFFERENCE = 70
 BASE_STEAL_CHANCE = 50.0
 MIN_STEAL_CHANCE = 5.0
@@ -47,35 +84,58 @@ MAX_NORMAL_STEAL_CHANCE = 75.0
 STOLEN_BONUS_CHANCE = 15.0
 ABSOLUTE_MAX_STEAL_CHANCE = 95.0 
 STEAL_COOLDOWN_HOURS = 1
+STEAL_LIMIT = 2 # Steals per server per STEAL_COOLDOWN_HOURS
+GUESS_LIMIT, GUESS_WINDOW_SECONDS = 5, 10 # Wrong guesses per user across every spawn, on top of each spawn's 3 tries
+SPAWN_COMMAND_LIMIT, SPAWN_COMMAND_WINDOW_SECONDS = 5, 60 # Manual spawns per server
+CONFIG_FLUSH_DEBOUNCE_SECONDS = 2 # Config changes are batched into one write this long after the latest...
+CONFIG_FLUSH_MAX_LATENCY_SECONDS = 10 # ...but never held back longer than this
+CONFIG_COMPACT_LINES = 500 # Saves appended to the config journal before it's folded back into server_configs.json
 DAILY_SPAWN_LIMIT = 2 # A card can only spawn this many times per day per server
+SPAWN_DISPATCH_CONCURRENCY = 8 # Timed spawns allowed in flight at once across all servers
+SPAWN_RETRY_SECONDS = 30 # Retry delay when a timed spawn's channel is unavailable or the spawn fails
 
 # --- Bot & Global Variables ---
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="$", intents=intents)
-ALL_CARDS, PREFIX_WEIGHTS, CARD_ANSWERS, SERVER_CONFIGS = [], {}, {}, {}
-CARD_RARITY_MAP = {}
-RECENTLY_SPAWNED = defaultdict(lambda: deque(maxlen=10))
+class InstrumentedCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras['started_at'] = time.perf_counter() # read back by record_command_latency
+        return True
+
+# Runs every shard Discord recommends, or only its own shards in a cluster worker
+class BlitzDexBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        await initialize_bot() # Runs once per process, before the first gateway connection; reconnects skip it
+
+    async def close(self):
+        await ATTACHMENT_URLS.close()
+        if CLUSTER_CLIENT: await CLUSTER_CLIENT.close()
+        await super().close()
+
+bot = BlitzDexBot(command_prefix="$", intents=intents, tree_cls=InstrumentedCommandTree)
+SERVER_CONFIGS = {}
+CATALOG = None # The installed CardCatalog; the four names below are views into it, rebound together by install_catalog
+ALL_CARDS, PREFIX_WEIGHTS, CARD_ANSWERS, CARD_RARITY_MAP = (), MappingProxyType({}), MappingProxyType({}), MappingProxyType({})
+CARD_CATALOG_VERSION = 0 # Bumped whenever a new catalog is installed, so derived tables know to rebuild too
+ORIGINAL_OWNERS = {} # unique_id -> original owner's user ID, mirrored from the steal log
+RECENT_SPAWN_MEMORY = 10 # A card can't respawn in a server until this many others have
+RECENTLY_SPAWNED = defaultdict(lambda: deque(maxlen=RECENT_SPAWN_MEMORY))
+CLUSTER_CLIENT = None # Set in cluster workers: the connection to the coordinator, which owns inventories, logs and configs
+CLUSTER_WORKER_INDEX, CLUSTER_SHARD_IDS, CLUSTER_SHARD_COUNT = None, None, None # None outside cluster mode
+CLUSTER_FAKE_GATEWAY = False
+CONFIG_JOURNAL_LINES = 0 # Saves in CONFIG_JOURNAL_FILE since server_configs.json was last written
 
 # --- 2. HELPER FUNCTIONS ---
 def ensure_data_files_exist():
-    if not os.path.exists(INVENTORY_CSV_FILE):
-        with open(INVENTORY_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(["user_id", "username", "card_name", "is_stolen", "unique_id"])
     if not os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, 'w') as f: json.dump({}, f)
-    if not os.path.exists(CLAIMS_CSV_FILE):
-        with open(CLAIMS_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(["timestamp", "user_id", "username", "card_name"])
-    if not os.path.exists(SPAWN_HISTORY_CSV_FILE):
-        with open(SPAWN_HISTORY_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(["timestamp", "guild_id", "card_name"])
-    if not os.path.exists(STEAL_LOG_CSV_FILE):
-        with open(STEAL_LOG_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerow(["unique_id", "original_owner_id"])
+    STORAGE.setup()
 
 def safe_atomic_write_json(filepath, data):
+    safe_atomic_write_text(filepath, json.dumps(data, separators=(',', ':')))
+
+def safe_atomic_write_text(filepath, text):
     temp_file = filepath + ".tmp"
-    with open(temp_file, 'w') as f: json.dump(data, f, indent=4)
+    with open(temp_file, 'w') as f: f.write(text)
     shutil.move(temp_file, filepath)
 
 def safe_atomic_write_csv(filepath, lines):
@@ -86,14 +146,105 @@ def safe_atomic_write_csv(filepath, lines):
 
 def load_configs():
     global SERVER_CONFIGS
+    if CLUSTER_CLIENT:
+        SERVER_CONFIGS = STORAGE.load_configs(); print(f"Fetched configs for {len(SERVER_CONFIGS)} server(s) from the coordinator."); return
     try:
         with open(CONFIG_FILE, 'r') as f: SERVER_CONFIGS = json.load(f)
         print(f"Loaded configs for {len(SERVER_CONFIGS)} server(s).")
     except (FileNotFoundError, json.JSONDecodeError):
         SERVER_CONFIGS = {}; print("No config file found.")
+    try:
+        with open(CONFIG_JOURNAL_FILE, 'r') as f: lines = f.readlines()
+    except FileNotFoundError: return
+    for line in lines:
+        try: apply_config_changes(json.loads(line))
+        except json.JSONDecodeError: pass # a save cut short by a crash
+    write_config_snapshot(json.dumps(SERVER_CONFIGS, separators=(',', ':')))
+    print(f"Replayed {len(lines)} config save(s) from the journal.")
+
+def apply_config_changes(changes: dict):
+    for guild_id_str, config in changes.items():
+        if config is None: SERVER_CONFIGS.pop(guild_id_str, None)
+        else: SERVER_CONFIGS[guild_id_str] = config
+
+# A None config marks a deleted one
+def config_changes(guild_ids) -> dict:
+    guild_ids = list(SERVER_CONFIGS) if guild_ids is None else {*guild_ids, *CONFIG_FLUSHER.dirty_guilds}
+    return {guild_id_str: SERVER_CONFIGS.get(guild_id_str) for guild_id_str in guild_ids}
+
+# One journal line of the changed configs, or every config once the journal is due for folding
+def config_write(guild_ids) -> tuple:
+    if guild_ids is None or CONFIG_JOURNAL_LINES >= CONFIG_COMPACT_LINES:
+        return write_config_snapshot, json.dumps(SERVER_CONFIGS, separators=(',', ':'))
+    return append_config_journal, json.dumps(config_changes(guild_ids), separators=(',', ':'))
+
+# Both count only writes that landed, so a failed snapshot is retried on the next save
+def write_config_snapshot(text: str):
+    global CONFIG_JOURNAL_LINES
+    safe_atomic_write_text(CONFIG_FILE, text)
+    with contextlib.suppress(FileNotFoundError): os.remove(CONFIG_JOURNAL_FILE)
+    CONFIG_JOURNAL_LINES = 0
+
+def append_config_journal(line: str):
+    global CONFIG_JOURNAL_LINES
+    with open(CONFIG_JOURNAL_FILE, 'a') as f: f.write(line + "\n")
+    CONFIG_JOURNAL_LINES += 1
+
+# Writes now; everything else goes through mark_config_dirty
+def save_configs(guild_ids=None):
+    write, payload = (STORAGE.save_configs, config_changes(guild_ids)) if CLUSTER_CLIENT else config_write(guild_ids)
+    CONFIG_FLUSHER.cancel()
+    write(payload)
+
+# Serialized here, written on the storage thread
+async def save_configs_async(guild_ids=None):
+    write, payload = (STORAGE.save_configs, config_changes(guild_ids)) if CLUSTER_CLIENT else config_write(guild_ids)
+    CONFIG_FLUSHER.cancel()
+    await STORAGE_IO.run(write, payload)
+
+# Debounces saves: a flush runs CONFIG_FLUSH_DEBOUNCE_SECONDS after the latest change, at most CONFIG_FLUSH_MAX_LATENCY_SECONDS after the first
+class ConfigFlusher:
+    def __init__(self):
+        self.dirty_guilds, self.first_dirty_at, self.timer = set(), None, None
+
+    def mark(self, guild_id_str: str):
+        self.dirty_guilds.add(guild_id_str)
+        try: loop = asyncio.get_running_loop()
+        except RuntimeError: self.flush(); return
+        now = loop.time()
+        if self.first_dirty_at is None: self.first_dirty_at = now
+        if self.timer: self.timer.cancel()
+        delay = min(CONFIG_FLUSH_DEBOUNCE_SECONDS, self.first_dirty_at + CONFIG_FLUSH_MAX_LATENCY_SECONDS - now)
+        self.timer = loop.call_later(max(delay, 0), self._fire)
+
+    def _fire(self):
+        self.timer = None
+        task = asyncio.create_task(self.flush_async())
+        STORAGE_IO.tasks.add(task); task.add_done_callback(STORAGE_IO.tasks.discard)
+
+    def cancel(self):
+        if self.timer: self.timer.cancel()
+        self.dirty_guilds, self.first_dirty_at, self.timer = set(), None, None
+
+    def flush(self):
+        if not (dirty := self.dirty_guilds): return
+        save_configs(dirty)
+        print(f"Saved configs ({len(dirty)} server(s) changed).")
+
+    async def flush_async(self):
+        if not (dirty := self.dirty_guilds): return
+        try: await save_configs_async(dirty)
+        except Exception:
+            print("--- FAILED TO SAVE CONFIGS (will retry) ---"); traceback.print_exc()
+            self.dirty_guilds |= dirty
+            self.timer = asyncio.get_running_loop().call_later(CONFIG_FLUSH_DEBOUNCE_SECONDS, self._fire)
+            return
+        print(f"Saved configs ({len(dirty)} server(s) changed).")
 
-def save_configs():
-    safe_atomic_write_json(CONFIG_FILE, SERVER_CONFIGS)
+CONFIG_FLUSHER = ConfigFlusher()
+
+def mark_config_dirty(guild_id_str: str):
+    CONFIG_FLUSHER.mark(guild_id_str)
 
 async def send_approval_dm(guild: discord.Guild) -> bool:
     try:
@@ -112,129 +263,1369 @@ async def send_approval_dm(guild: discord.Guild) -> bool:
         print(f"CRITICAL: Could not find owner with ID {OWNER_ID}. Is the ID correct?")
     return False
 
-def add_card_to_inventory(user: discord.User, card_name: str, is_stolen: bool = False, unique_id: str = None) -> str:
+# --- Metrics ---
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9108)) # Serves /metrics for Prometheus; 0 turns the endpoint off
+LOOP_LAG_SAMPLE_SECONDS = 5
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_HELP = {
+    "command_seconds": "Slash command handler latency.",
+    "view_callback_seconds": "Button, select and modal callback latency.",
+    "storage_seconds": "Time spent in each storage operation on the storage thread.",
+    "spawn_dispatch_delay_seconds": "How late timed spawns start relative to their next_spawn_time.",
+    "event_loop_lag_seconds": "Delay before the event loop gets back to a task that yields.",
+    "cluster_call_seconds": "Round trip of a cluster worker's calls to the coordinator.",
+}
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+    def __init__(self):
+        self.counts, self.total, self.count = [0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0 # the last slot is +Inf
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value; self.count += 1
+
+    def quantile(self, q: float) -> float:
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return 0.0
+
+# Safe to record from the storage thread
+class Metrics:
+    def __init__(self):
+        self.histograms = {} # (name, sorted label items) -> Histogram
+        self.gauges = {} # name -> (help, type, fn)
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if (histogram := self.histograms.get(key)) is None: histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name: str, help_text: str, fn, kind: str = "gauge"):
+        self.gauges[name] = (help_text, kind, fn)
+
+    def series(self, name: str) -> list:
+        with self.lock: return [(dict(labels), histogram) for (metric, labels), histogram in self.histograms.items() if metric == name]
+
+    # Prometheus text exposition format
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            items = [*labels, *extra]
+            if not items: return ""
+            return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in items) + "}"
+        lines = []
+        with self.lock: histograms = sorted((key, list(h.counts), h.total, h.count) for key, h in self.histograms.items())
+        for name in sorted({key[0] for key, *_ in histograms}):
+            lines += [f"# HELP blitzdex_{name} {METRIC_HELP.get(name, name)}", f"# TYPE blitzdex_{name} histogram"]
+            for (metric, labels), counts, total, count in histograms:
+                if metric != name: continue
+                cumulative = 0
+                for bound, n in zip([*LATENCY_BUCKETS, "+Inf"], counts):
+                    cumulative += n; lines.append(f"blitzdex_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines += [f"blitzdex_{name}_sum{fmt(labels)} {total}", f"blitzdex_{name}_count{fmt(labels)} {count}"]
+        for name, (help_text, kind, fn) in sorted(self.gauges.items()):
+            try: value = fn()
+            except Exception: continue
+            lines += [f"# HELP blitzdex_{name} {help_text}", f"# TYPE blitzdex_{name} {kind}", f"blitzdex_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+METRICS = Metrics()
+
+def timed(name: str, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with METRICS.timer(name, **labels): return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_command_latency(interaction: discord.Interaction, status: str):
+    started, command = interaction.extras.pop('started_at', None), interaction.command
+    if started is not None and command is not None:
+        METRICS.observe("command_seconds", time.perf_counter() - started, command=command.qualified_name, status=status)
+
+class TimedView(ui.View):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for item in self.children: self._time_item(item)
+
+    def add_item(self, item: ui.Item):
+        self._time_item(item)
+        return super().add_item(item)
+
+    def _time_item(self, item: ui.Item):
+        callback = item.callback
+        name = getattr(getattr(callback, 'callback', callback), '__name__', 'callback') # decorated items wrap the method
+        if name == 'callback': name = type(item).__name__ # ui.Select subclasses override callback itself
+        view_name = type(self).__name__
+        async def timed_callback(interaction: discord.Interaction):
+            with METRICS.timer("view_callback_seconds", view=view_name, item=name): await callback(interaction)
+        item.callback = timed_callback
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=METRICS.render(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server():
+    if not METRICS_PORT: return
+    app = web.Application(); app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None); await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"WARNING: Could not start the metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}"); await runner.cleanup()
+
+@tasks.loop(seconds=LOOP_LAG_SAMPLE_SECONDS)
+async def loop_lag_sampler():
+    loop = asyncio.get_running_loop(); start = loop.time()
+    await asyncio.sleep(0)
+    METRICS.observe("event_loop_lag_seconds", loop.time() - start)
+
+# --- Storage Backends ---
+INVENTORY_HEADER = ["user_id", "username", "card_name", "is_stolen", "unique_id"]
+# 'journal' appends small add/remove records and compacts in the background; 'snapshot' rewrites the CSV on removals.
+INVENTORY_PERSISTENCE = os.environ.get('INVENTORY_PERSISTENCE', 'journal')
+INVENTORY_COMPACT_MAX_BYTES = 16 * 1024 * 1024 # Compact once the journal reaches this size...
+INVENTORY_COMPACT_MIN_RECORDS = 1000 # ...or once it holds at least this many records
+INVENTORY_COMPACT_RATIO = 0.5 # ...and they make up this fraction of the live card count.
+LOG_HEADERS = {"claims": ["timestamp", "user_id", "username", "card_name", "guild_id"], "spawns": ["timestamp", "guild_id", "card_name"]}
+LOG_ARCHIVE_AFTER_DAYS = 2 # Log segments at least this many days old are gzipped by log_archiver...
+LOG_ARCHIVE_INTERVAL_SECONDS = 3600 # ...which checks this often
+
+def new_unique_id(card_name: str) -> str:
+    return f"{card_name}-{datetime.now(timezone.utc).timestamp()}-{random.randint(1000,9999)}"
+
+def parse_iso_date(timestamp: str):
+    try: return datetime.fromisoformat(timestamp).date()
+    except (ValueError, TypeError): return None
+
+# Inventory rows are (user_id, username, card_name, is_stolen, unique_id); ops are ['+', *row fields] or ['-', unique_id]
+class StorageBackend(ABC):
+    def setup(self): pass
+    @abstractmethod
+    def load_inventory(self) -> list: ...
+    def wants_snapshot(self, ops: list, live_count: int) -> bool: return False
+    @abstractmethod
+    def write_inventory(self, ops: list, snapshot: list = None): ...
+    @abstractmethod
+    def log_claims(self, rows: list): ... # (timestamp, user_id, username, card_name, guild_id)
+    @abstractmethod
+    def log_spawns(self, rows: list): ... # (timestamp, guild_id, card_name)
+    @abstractmethod
+    def log_original_owners(self, rows: list): ... # (unique_id, owner_id)
+    @abstractmethod
+    def iter_original_owners(self): ...
+    @abstractmethod
+    def iter_claims(self): ... # (timestamp, user_id, username, card_name, guild_id or None)
+    def claim_totals(self) -> Counter: # (guild_id, user_id, card_name) -> claims
+        return Counter((guild_id, user_id, card_name) for _, user_id, _, card_name, guild_id in self.iter_claims())
+    @abstractmethod
+    def spawns_on(self, day) -> list: ...
+    @abstractmethod
+    def recent_spawns(self, per_guild: int) -> list: ...
+    def archive_logs(self) -> int: return 0 # Number of log segments compressed
+    def close(self): pass
+
+# In journal mode user_inventories.csv is a snapshot and mutations are appended to a journal replayed over it
+class CsvStorage(StorageBackend):
+    def __init__(self, mode: str = 'journal'):
+        self.inventory_path, self.journal_path = INVENTORY_CSV_FILE, INVENTORY_JOURNAL_FILE
+        self.compacting_path = self.journal_path + ".compacting"
+        self.steal_log_path = STEAL_LOG_CSV_FILE
+        self.legacy_logs = {"claims": CLAIMS_CSV_FILE, "spawns": SPAWN_HISTORY_CSV_FILE}
+        self.log_dirs = {kind: os.path.join(LOGS_PATH, kind) for kind in LOG_HEADERS}
+        self.spawn_tails = {}  # guild_id -> its last RECENT_SPAWN_MEMORY card names, mirrored to SPAWN_TAILS_PATH
+        self.mode = mode
+        self.journal_records, self.journal_bytes, self.compaction_thread = 0, 0, None
+
+    def setup(self):
+        for path, header in ((self.inventory_path, INVENTORY_HEADER), (self.steal_log_path, ["unique_id", "original_owner_id"])):
+            if not os.path.exists(path):
+                with open(path, 'w', newline='', encoding='utf-8') as f: csv.writer(f).writerow(header)
+        for directory in self.log_dirs.values(): os.makedirs(directory, exist_ok=True)
+        for kind in self.log_dirs: self._import_legacy_log(kind)
+        self._load_spawn_tails()
+
+    def _append(self, path: str, rows: list):
+        with open(path, 'a', newline='', encoding='utf-8') as f: csv.writer(f).writerows(rows)
+
+    # Inventory
+    def load_inventory(self) -> list:
+        cards, repaired = {}, False  # unique_id -> row, in file order
+        try:
+            with open(self.inventory_path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    user_id = (row.get('user_id') or '').strip()
+                    if not (user_id.isdigit() and row.get('card_name')): continue
+                    unique_id = row.get('unique_id') or ''
+                    if not unique_id or unique_id in cards:
+                        # Legacy or duplicated rows get a fresh ID so every card stays addressable.
+                        unique_id, repaired = new_unique_id(row['card_name']), True
+                    is_stolen = (row.get('is_stolen') or '').strip().lower() == 'true'
+                    cards[unique_id] = (int(user_id), row.get('username') or '', row['card_name'], is_stolen, unique_id)
+        except FileNotFoundError: pass
+        replayed = sum(self._replay(path, cards) for path in (self.compacting_path, self.journal_path))
+        if replayed: print(f"Replayed {replayed} inventory journal record(s).")
+        if replayed or repaired:
+            self._write_snapshot(self._rows(cards.values()))
+            for path in (self.compacting_path, self.journal_path):
+                if os.path.exists(path): os.remove(path)
+        return list(cards.values())
+
+    # Records are idempotent, so replaying a journal a crashed compaction already folded in is harmless
+    @staticmethod
+    def _replay(path: str, cards: dict) -> int:
+        count = 0
+        try:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                for record in csv.reader(f):
+                    if len(record) == 6 and record[0] == '+' and record[1].isdigit():
+                        cards.pop(record[5], None)
+                        cards[record[5]] = (int(record[1]), record[2], record[3], record[4] == 'True', record[5])
+                    elif len(record) == 2 and record[0] == '-':
+                        cards.pop(record[1], None)
+                    else: continue # A torn final line from a crash mid-append.
+                    count += 1
+        except FileNotFoundError: pass
+        return count
+
+    @staticmethod
+    def _rows(cards) -> list:
+        return [INVENTORY_HEADER] + [[user_id, username, name, 'True' if is_stolen else '', unique_id] for user_id, username, name, is_stolen, unique_id in cards]
+
+    def _write_snapshot(self, rows: list):
+        safe_atomic_write_csv(self.inventory_path, rows)
+
+    def wants_snapshot(self, ops: list, live_count: int) -> bool:
+        if self.mode != 'journal': return any(op[0] == '-' for op in ops)
+        if self.compaction_thread and self.compaction_thread.is_alive(): return False
+        records = self.journal_records + len(ops)
+        return self.journal_bytes >= INVENTORY_COMPACT_MAX_BYTES or (
+            records >= INVENTORY_COMPACT_MIN_RECORDS and records >= INVENTORY_COMPACT_RATIO * live_count)
+
+    def write_inventory(self, ops: list, snapshot: list = None):
+        if self.mode != 'journal':
+            if snapshot is not None: self._write_snapshot(self._rows(snapshot))
+            elif ops: self._append(self.inventory_path, [op[1:] for op in ops])
+            return
+        if ops:
+            with open(self.journal_path, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(ops); self.journal_bytes = f.tell()
+            self.journal_records += len(ops)
+        if snapshot is not None: self.start_compaction(snapshot)
+
+    # New records go to a fresh journal while the rotated one is folded into the snapshot
+    def start_compaction(self, cards: list):
+        if os.path.exists(self.compacting_path) and os.path.exists(self.journal_path):
+            # A previous compaction failed; keep its records and fold the live journal in behind them.
+            with open(self.journal_path, 'rb') as f_in, open(self.compacting_path, 'ab') as f_out: shutil.copyfileobj(f_in, f_out)
+            os.remove(self.journal_path)
+        elif os.path.exists(self.journal_path): os.replace(self.journal_path, self.compacting_path)
+        self.journal_records, self.journal_bytes = 0, 0
+        rows = self._rows(cards)
+        def compact():
+            try:
+                self._write_snapshot(rows)
+                os.remove(self.compacting_path)
+                print(f"Compacted inventory journal into a snapshot of {len(rows) - 1} card(s).")
+            except FileNotFoundError: pass
+            except Exception:
+                print("--- INVENTORY COMPACTION FAILED (journal kept for replay) ---"); traceback.print_exc()
+        self.compaction_thread = threading.Thread(target=compact, name="inventory-compaction", daemon=True)
+        self.compaction_thread.start()
+
+    # Logs: one segment per UTC day in logs/claims/ and logs/spawns/, named YYYY-MM-DD.csv (.csv.gz once archived)
+    def _segment_path(self, kind: str, day, compressed: bool = False) -> str:
+        return os.path.join(self.log_dirs[kind], f"{day.isoformat()}.csv" + (".gz" if compressed else ""))
+
+    def _segment_days(self, kind: str) -> list:
+        days = {parse_iso_date(name.split('.', 1)[0]) for name in os.listdir(self.log_dirs[kind]) if name.endswith(('.csv', '.csv.gz'))}
+        return sorted(day for day in days if day)
+
+    # A row logged late for an archived day starts a new plain segment
+    def _read_segment(self, kind: str, day, parts=(True, False)):
+        for compressed in parts:
+            path, opener = self._segment_path(kind, day, compressed), gzip.open if compressed else open
+            try:
+                with opener(path, 'rt', newline='', encoding='utf-8') as f:
+                    reader = csv.reader(f); next(reader, None)
+                    yield from reader
+            except FileNotFoundError: pass
+
+    def _append_log(self, kind: str, rows: list):
+        by_day, today = defaultdict(list), datetime.now(timezone.utc).date()
+        for row in rows: by_day[parse_iso_date(row[0]) or today].append(row)
+        for day, day_rows in by_day.items():
+            path = self._segment_path(kind, day)
+            if not os.path.exists(path): day_rows = [LOG_HEADERS[kind], *day_rows]
+            self._append(path, day_rows)
+
+    # Days that already have a segment are skipped, so an interrupted import just runs again
+    def _import_legacy_log(self, kind: str):
+        legacy = self.legacy_logs[kind]
+        if not os.path.exists(legacy): return
+        by_day, day = defaultdict(list), date(1970, 1, 1)
+        with open(legacy, 'r', newline='', encoding='utf-8') as f:
+            if kind == "spawns": rows = ([row.get(column) or '' for column in LOG_HEADERS[kind]] for row in csv.DictReader(f))
+            else: rows = csv.reader(f); next(rows, None) # the old claims header is unreliable; columns are positional
+            for row in rows:
+                if not any(row): continue
+                day = parse_iso_date(row[0]) or day # undated rows stay with the row before them
+                by_day[day].append(row)
+        existing = set(self._segment_days(kind))
+        for day, rows in by_day.items():
+            if day in existing: continue
+            path = self._segment_path(kind, day)
+            with open(path + ".tmp", 'w', newline='', encoding='utf-8') as f: csv.writer(f).writerows([LOG_HEADERS[kind], *rows])
+            os.replace(path + ".tmp", path)
+        with open(legacy, 'rb') as source, gzip.open(legacy + ".imported.gz.tmp", 'wb') as archive: shutil.copyfileobj(source, archive)
+        os.replace(legacy + ".imported.gz.tmp", legacy + ".imported.gz"); os.remove(legacy)
+        print(f"Split {os.path.basename(legacy)} into {len(by_day)} daily segment(s); the original is kept as {os.path.basename(legacy)}.imported.gz.")
+
+    def _load_spawn_tails(self):
+        try:
+            if os.path.exists(SPAWN_TAILS_FILE):
+                with open(SPAWN_TAILS_FILE, 'r') as f: self.spawn_tails = {int(guild_id): names for guild_id, names in json.load(f).items()}
+                self._save_spawn_tails(self.spawn_tails); os.remove(SPAWN_TAILS_FILE)
+                return
+            if not os.path.isdir(SPAWN_TAILS_PATH): raise FileNotFoundError(SPAWN_TAILS_PATH)
+            for filename in os.listdir(SPAWN_TAILS_PATH):
+                if not filename.endswith(".json"): continue
+                with open(os.path.join(SPAWN_TAILS_PATH, filename), 'r') as f: self.spawn_tails[int(filename[:-5])] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError):
+            # First start on segmented logs, or a damaged tail file: rebuild them from the full spawn log once.
+            tails = defaultdict(lambda: deque(maxlen=RECENT_SPAWN_MEMORY))
+            for _, guild_id, card_name in self.iter_spawns(): tails[guild_id].append(card_name)
+            self.spawn_tails = {guild_id: list(names) for guild_id, names in tails.items()}
+            self._save_spawn_tails(self.spawn_tails)
+
+    def _save_spawn_tails(self, tails: dict):
+        os.makedirs(SPAWN_TAILS_PATH, exist_ok=True)
+        for guild_id, names in tails.items(): safe_atomic_write_json(os.path.join(SPAWN_TAILS_PATH, f"{guild_id}.json"), names)
+
+    def log_claims(self, rows: list):
+        self._append_log("claims", rows)
+
+    def log_spawns(self, rows: list):
+        self._append_log("spawns", rows)
+        changed = {}
+        for _, guild_id, card_name in rows:
+            tail = changed[int(guild_id)] = self.spawn_tails.setdefault(int(guild_id), [])
+            tail.append(card_name); del tail[:-RECENT_SPAWN_MEMORY]
+        self._save_spawn_tails(changed) # only the servers in this batch
+
+    def log_original_owners(self, rows: list):
+        self._append(self.steal_log_path, rows)
+
+    def spawns_on(self, day) -> list:
+        return [(int(row[1]), row[2]) for row in self._read_segment("spawns", day) if len(row) >= 3 and row[1].strip().isdigit()]
+
+    def recent_spawns(self, per_guild: int) -> list:
+        return [(guild_id, card_name) for guild_id, names in self.spawn_tails.items() for card_name in names[-per_guild:]]
+
+    # Runs on the storage thread, so no append races it
+    def archive_logs(self) -> int:
+        cutoff, archived = datetime.now(timezone.utc).date() - timedelta(days=LOG_ARCHIVE_AFTER_DAYS), 0
+        through, totals = self._load_claim_totals()
+        late_claims = 0
+        for kind in self.log_dirs:
+            for day in self._segment_days(kind):
+                plain, compressed = self._segment_path(kind, day), self._segment_path(kind, day, True)
+                if day > cutoff or not os.path.exists(plain): continue
+                with open(plain, 'rb') as f: data = f.read()
+                if os.path.exists(compressed): # late rows reopened an archived day; fold them in without their header
+                    late = data.split(b'\n', 1)[-1]
+                    if kind == "claims" and through and day <= through: # already in the claim totals, so count just these rows
+                        late_claims += self._count_claims(csv.reader(io.StringIO(late.decode('utf-8'))), totals)
+                    with gzip.open(compressed, 'rb') as f: data = f.read() + late
+                with gzip.open(compressed + ".tmp", 'wb') as f: f.write(data)
+                os.replace(compressed + ".tmp", compressed); os.remove(plain)
+                archived += 1
+        folded = [day for day in self._segment_days("claims") if day <= cutoff and (through is None or day > through)]
+        for day in folded: self._count_claims(self._read_segment("claims", day, parts=(True,)), totals)
+        if folded or late_claims: self._save_claim_totals(folded[-1] if folded else through, totals)
+        return archived
+
+    # Claim totals of archived days: {"through": last archived day counted, "totals": [[guild_id, user_id, card_name, claims], ...]}
+    def _load_claim_totals(self) -> tuple:
+        try:
+            with open(CLAIM_TOTALS_FILE, 'r') as f: saved = json.load(f)
+            return date.fromisoformat(saved["through"]), Counter({(guild_id, user_id, card_name): count for guild_id, user_id, card_name, count in saved["totals"]})
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError): return None, Counter()
+
+    def _save_claim_totals(self, through, totals: Counter):
+        safe_atomic_write_json(CLAIM_TOTALS_FILE, {"through": through.isoformat(), "totals": [[*key, count] for key, count in totals.items()]})
+
+    @staticmethod
+    def _claim_row(row: list):
+        if len(row) >= 4 and row[1].strip().isdigit():
+            return row[0], int(row[1]), row[2], row[3], int(row[4]) if len(row) > 4 and row[4].isdigit() else None
+
+    def _count_claims(self, rows, totals: Counter) -> int:
+        counted = 0
+        for row in rows:
+            if claim := self._claim_row(row): totals[(claim[4], claim[1], claim[3])] += 1; counted += 1
+        return counted
+
+    # Saved totals, plus recent segments and rows logged late for archived days
+    def claim_totals(self) -> Counter:
+        through, totals = self._load_claim_totals()
+        for day in self._segment_days("claims"):
+            self._count_claims(self._read_segment("claims", day, (True, False) if through is None or day > through else (False,)), totals)
+        return totals
+
+    # Raw readers, used at startup and by the SQLite migration
+    def iter_spawns(self):
+        for day in self._segment_days("spawns"):
+            for row in self._read_segment("spawns", day):
+                if len(row) >= 3 and row[1].strip().isdigit() and row[2]: yield row[0], int(row[1]), row[2]
+
+    def iter_claims(self):
+        for day in self._segment_days("claims"):
+            for row in self._read_segment("claims", day):
+                if claim := self._claim_row(row): yield claim
+
+    def iter_original_owners(self):
+        try:
+            with open(self.steal_log_path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    owner_id = (row.get('original_owner_id') or '').strip()
+                    if row.get('unique_id') and owner_id.isdigit(): yield row['unique_id'], int(owner_id)
+        except FileNotFoundError: return
+
+    def close(self):
+        if self.compaction_thread: self.compaction_thread.join()
+
+class SqliteStorage(StorageBackend):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS inventory (seq INTEGER PRIMARY KEY AUTOINCREMENT, unique_id TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL, username TEXT NOT NULL, card_name TEXT NOT NULL, is_stolen INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS idx_inventory_user ON inventory (user_id);
+        CREATE TABLE IF NOT EXISTS claims (id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, user_id INTEGER NOT NULL,
+            username TEXT NOT NULL, card_name TEXT NOT NULL, guild_id INTEGER);
+        CREATE INDEX IF NOT EXISTS idx_claims_user ON claims (user_id);
+        CREATE TABLE IF NOT EXISTS claim_totals (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, card_name TEXT NOT NULL,
+            claims INTEGER NOT NULL, PRIMARY KEY (guild_id, user_id, card_name)); -- guild_id 0: claimed before servers were recorded
+        CREATE TRIGGER IF NOT EXISTS claims_count AFTER INSERT ON claims BEGIN
+            INSERT INTO claim_totals VALUES (COALESCE(NEW.guild_id, 0), NEW.user_id, NEW.card_name, 1)
+                ON CONFLICT (guild_id, user_id, card_name) DO UPDATE SET claims = claims + 1;
+        END;
+        CREATE TABLE IF NOT EXISTS spawns (id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, date TEXT,
+            guild_id INTEGER NOT NULL, card_name TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_spawns_guild_date ON spawns (guild_id, date);
+        CREATE INDEX IF NOT EXISTS idx_spawns_guild ON spawns (guild_id);
+        CREATE INDEX IF NOT EXISTS idx_spawns_date ON spawns (date);
+        CREATE TABLE IF NOT EXISTS steal_log (unique_id TEXT PRIMARY KEY, original_owner_id INTEGER NOT NULL);
+    """
+    def __init__(self, db_path: str):
+        self.db_path, self.conn = db_path, None
+        self.lock = threading.Lock()
+
+    def setup(self):
+        if self.conn: return
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        if "guild_id" not in {column[1] for column in self.conn.execute("PRAGMA table_info(claims)")}:
+            self.conn.execute("ALTER TABLE claims ADD COLUMN guild_id INTEGER") # databases created before claims recorded their server
+        if not self.conn.execute("SELECT 1 FROM claim_totals LIMIT 1").fetchone(): # first start with claim_totals: count what's there
+            self.conn.execute("INSERT INTO claim_totals SELECT COALESCE(guild_id, 0), user_id, card_name, COUNT(*) FROM claims GROUP BY 1, 2, 3")
+
+    def _write(self, sql: str, rows: list):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try: self.conn.executemany(sql, rows); self.conn.execute("COMMIT")
+            except Exception: self.conn.execute("ROLLBACK"); raise
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self.lock: return self.conn.execute(sql, params).fetchall()
+
+    def load_inventory(self) -> list:
+        rows = self._query("SELECT user_id, username, card_name, is_stolen, unique_id FROM inventory ORDER BY seq")
+        return [(user_id, username, card_name, bool(is_stolen), unique_id) for user_id, username, card_name, is_stolen, unique_id in rows]
+
+    def write_inventory(self, ops: list, snapshot: list = None):
+        if not ops: return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for op in ops:
+                    if op[0] == '+':
+                        # REPLACE re-inserts a moved card at the end, matching the CSV's append order.
+                        self.conn.execute("INSERT OR REPLACE INTO inventory (user_id, username, card_name, is_stolen, unique_id) VALUES (?, ?, ?, ?, ?)",
+                                          (op[1], op[2], op[3], op[4] == 'True', op[5]))
+                    else: self.conn.execute("DELETE FROM inventory WHERE unique_id = ?", (op[1],))
+                self.conn.execute("COMMIT")
+            except Exception: self.conn.execute("ROLLBACK"); raise
+
+    def log_claims(self, rows: list):
+        self._write("INSERT INTO claims (timestamp, user_id, username, card_name, guild_id) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def log_spawns(self, rows: list):
+        self._write("INSERT INTO spawns (timestamp, date, guild_id, card_name) VALUES (?, ?, ?, ?)",
+                    [(timestamp, (day := parse_iso_date(timestamp)) and day.isoformat(), guild_id, card_name) for timestamp, guild_id, card_name in rows])
+
+    def log_original_owners(self, rows: list):
+        # The CSV lookup returns the first logged owner, so later duplicates are ignored here too.
+        self._write("INSERT OR IGNORE INTO steal_log (unique_id, original_owner_id) VALUES (?, ?)", rows)
+
+    def iter_original_owners(self):
+        return self._query("SELECT unique_id, original_owner_id FROM steal_log")
+
+    def iter_claims(self):
+        return self._query("SELECT timestamp, user_id, username, card_name, guild_id FROM claims ORDER BY id")
+
+    def claim_totals(self) -> Counter:
+        return Counter({(guild_id or None, user_id, card_name): count for guild_id, user_id, card_name, count in
+                        self._query("SELECT guild_id, user_id, card_name, claims FROM claim_totals")})
+
+    def spawns_on(self, day) -> list:
+        return self._query("SELECT guild_id, card_name FROM spawns WHERE date = ? ORDER BY id", (day.isoformat(),))
+
+    def recent_spawns(self, per_guild: int) -> list:
+        # Skips from guild to guild through idx_spawns_guild, an implicit (guild_id, id) index, and walks back per_guild rows in each.
+        return self._query("""
+            WITH RECURSIVE guilds (guild_id) AS (SELECT MIN(guild_id) FROM spawns
+                UNION ALL SELECT (SELECT MIN(guild_id) FROM spawns WHERE guild_id > guilds.guild_id) FROM guilds WHERE guild_id IS NOT NULL)
+            SELECT spawns.guild_id, card_name FROM guilds JOIN spawns ON spawns.id IN
+                (SELECT id FROM spawns WHERE guild_id = guilds.guild_id ORDER BY id DESC LIMIT ?)
+            ORDER BY spawns.id""", (per_guild,))
+
+    def import_from(self, source: CsvStorage):
+        if self._query("SELECT 1 FROM inventory LIMIT 1") or self._query("SELECT 1 FROM spawns LIMIT 1"):
+            raise RuntimeError(f"'{self.db_path}' already contains data; refusing to import over it.")
+        cards = source.load_inventory()
+        self._write("INSERT INTO inventory (user_id, username, card_name, is_stolen, unique_id) VALUES (?, ?, ?, ?, ?)", cards)
+        claims = list(source.iter_claims())
+        self.log_claims(claims)
+        spawns = list(source.iter_spawns())
+        self.log_spawns(spawns)
+        owners = list(source.iter_original_owners())
+        self.log_original_owners(owners)
+        print(f"Imported {len(cards)} inventory card(s), {len(claims)} claim(s), {len(spawns)} spawn(s) and {len(owners)} owner record(s) into '{self.db_path}'.")
+
+    def close(self):
+        if self.conn:
+            with self.lock: self.conn.close(); self.conn = None
+
+def create_storage_backend() -> StorageBackend:
+    if STORAGE_BACKEND == 'sqlite': return SqliteStorage(SQLITE_DB_FILE)
+    return CsvStorage(INVENTORY_PERSISTENCE)
+
+STORAGE = create_storage_backend()
+
+# One thread for blocking storage work; records submitted during a write are batched into the next one
+class StorageIO:
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-io")
+        self.pending, self.waiters, self.drainer, self.tasks = defaultdict(list), [], None, set()
+
+    async def run(self, func, *args):
+        # Shielded so work that has been handed to the thread still lands if the caller is cancelled at shutdown.
+        return await asyncio.shield(asyncio.get_running_loop().run_in_executor(self.executor, self._timed, func, *args))
+
+    def _timed(self, func, *args):
+        if func == self._write_batch: return func(*args) # timed per log inside
+        with METRICS.timer("storage_seconds", op=func.__name__): return func(*args)
+
+    # Outside an event loop the record is written immediately
+    def submit(self, method: str, row: tuple, wait: bool = False) -> asyncio.Future:
+        try: loop = asyncio.get_running_loop()
+        except RuntimeError:
+            getattr(self.backend, method)([row]); return None
+        self.pending[method].append(row)
+        future = None
+        if wait: future = loop.create_future(); self.waiters.append(future)
+        if self.drainer is None or self.drainer.done(): self.drainer = loop.create_task(self._drain())
+        return future
+
+    def _write_batch(self, batch: dict):
+        for method, rows in batch.items():
+            with METRICS.timer("storage_seconds", op=method): getattr(self.backend, method)(rows)
+
+    async def _drain(self):
+        while self.pending:
+            batch, waiters = self.pending, self.waiters
+            self.pending, self.waiters = defaultdict(list), []
+            try: await self.run(self._write_batch, batch)
+            except Exception as e:
+                print(f"--- FAILED TO WRITE {sum(map(len, batch.values()))} LOG RECORD(S) ---"); traceback.print_exc()
+                for waiter in waiters:
+                    if not waiter.done(): waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done(): waiter.set_result(None)
+
+    # Waits for in-flight work, then writes what is still queued
+    def close(self):
+        self.executor.shutdown(wait=True)
+        batch, self.pending = self.pending, defaultdict(list)
+        self._write_batch(batch)
+
+STORAGE_IO = StorageIO(STORAGE)
+
+# --- Autocomplete ---
+AUTOCOMPLETE_LIMIT = 25 # Discord shows at most this many choices
+
+# Prefix matches first, then names containing the query further in
+class NameIndex:
+    __slots__ = ('names', 'lowered', 'members')
+    def __init__(self, names):
+        pairs = sorted({(name.lower(), name) for name in names})
+        self.lowered, self.names = [low for low, _ in pairs], [name for _, name in pairs]
+        self.members = frozenset(self.names)
+
+    def __contains__(self, name: str) -> bool: return name in self.members
+    def __len__(self) -> int: return len(self.names)
+
+    def search(self, current: str, limit: int = AUTOCOMPLETE_LIMIT) -> list:
+        query = current.lower()
+        if not query: return self.names[:limit]
+        start = bisect.bisect_left(self.lowered, query)
+        end = start
+        while end < len(self.lowered) and self.lowered[end].startswith(query): end += 1
+        results = self.names[start:min(end, start + limit)]
+        if len(results) < limit:
+            results += itertools.islice((self.names[i] for i, low in enumerate(self.lowered) if query in low and not start <= i < end), limit - len(results))
+        return results
+
+    def choices(self, current: str) -> list:
+        return [app_commands.Choice(name=name, value=name) for name in self.search(current)]
+
+def catalog_name_index() -> NameIndex:
+    return CATALOG.name_index if CATALOG else NameIndex(())
+
+# --- Inventory Store ---
+INVENTORY_FLUSH_SECONDS = 5
+
+# Reads never touch the disk; mutations are written behind by inventory_flusher
+class InventoryStore:
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.by_user = defaultdict(list)  # user_id -> cards, in acquisition order
+        self.by_unique_id = {}  # unique_id -> card, in acquisition order (used for snapshots)
+        self.pending_ops, self.loaded, self.loading = [], False, False
+        self.name_indexes = {}  # (user_id, stealable_only) -> NameIndex of distinct names
+        self.counts = defaultdict(dict)  # user_id -> card name -> [clean copies, stolen copies]
+        self.versions = defaultdict(int)  # user_id -> bumped on every change to that user's inventory
+
+    def load(self):
+        if self.loaded: return
+        self.loading = True # LEADERBOARDS is rebuilt once at the end rather than updated card by card
+        for row in self.backend.load_inventory(): self._insert(*row)
+        self.loaded, self.loading = True, False
+        LEADERBOARDS.rebuild(self.counts)
+        print(f"Loaded {len(self.by_unique_id)} inventory card(s) for {len(self.by_user)} user(s).")
+
+    def _insert(self, user_id: int, username: str, card_name: str, is_stolen: bool, unique_id: str) -> dict:
+        card = {"name": card_name, "is_stolen": is_stolen, "unique_id": unique_id, "user_id": user_id, "username": username}
+        self.by_user[user_id].append(card)
+        self.by_unique_id[unique_id] = card
+        count = self.counts[user_id].setdefault(card_name, [0, 0]); count[1 if is_stolen else 0] += 1
+        self._invalidate_names(user_id)
+        if not self.loading: LEADERBOARDS.card_changed(user_id, card_name, is_stolen, 1, sum(count))
+        return card
+
+    def _discard(self, unique_id: str) -> dict:
+        card = self.by_unique_id.pop(unique_id, None)
+        if card is not None:
+            cards = self.by_user[card['user_id']]
+            cards.remove(card)
+            if not cards: del self.by_user[card['user_id']]
+            counts = self.counts[card['user_id']]; count = counts[card['name']]
+            count[1 if card['is_stolen'] else 0] -= 1
+            if not any(count): del counts[card['name']]
+            if not counts: del self.counts[card['user_id']]
+            self._invalidate_names(card['user_id'])
+            LEADERBOARDS.card_changed(card['user_id'], card['name'], card['is_stolen'], -1, sum(count))
+        return card
+
+    def _invalidate_names(self, user_id: int):
+        self.name_indexes.pop((user_id, False), None); self.name_indexes.pop((user_id, True), None)
+        self.versions[user_id] += 1
+
+    def rarities_changed(self):
+        for key in [key for key in self.name_indexes if key[1]]: del self.name_indexes[key]
+        LEADERBOARDS.rebuild(self.counts)
+
+    def version(self, user_id: int) -> int:
+        return self.versions.get(user_id, 0)
+
+    # card name -> [clean, stolen]; don't mutate it
+    def card_counts(self, user_id: int) -> dict:
+        return self.counts.get(user_id, {})
+
+    def names(self, user_id: int, stealable_only: bool = False) -> NameIndex:
+        key = (user_id, stealable_only)
+        if (index := self.name_indexes.get(key)) is None:
+            names = (c['name'] for c in self.by_user.get(user_id, ()))
+            if stealable_only: names = [name for name in names if CARD_RARITY_MAP.get(name) in STEALABLE_RARITIES]
+            index = self.name_indexes[key] = NameIndex(names)
+        return index
+
+    def snapshot_rows(self) -> list:
+        return [(c['user_id'], c['username'], c['name'], c['is_stolen'], c['unique_id']) for c in self.by_unique_id.values()]
+
+    def get(self, user_id: int) -> list:
+        return list(self.by_user.get(user_id, ()))
+
+    def add(self, user_id: int, username: str, card_name: str, is_stolen: bool, unique_id: str):
+        self._discard(unique_id)
+        self._insert(user_id, username, card_name, is_stolen, unique_id)
+        self.pending_ops.append(['+', user_id, username, card_name, 'True' if is_stolen else '', unique_id])
+
+    def remove(self, user_id: int, card_name: str) -> dict:
+        cards = self.by_user.get(user_id)
+        card = next((c for c in cards if c['name'].lower() == card_name.lower()), None) if cards else None
+        if card is None: return None
+        self._discard(card['unique_id'])
+        self.pending_ops.append(['-', card['unique_id']])
+        return {"user_id": str(user_id), "username": card['username'], "card_name": card['name'], "is_stolen": 'True' if card['is_stolen'] else '', "unique_id": card['unique_id']}
+
+    # All or nothing, in one inventory write. A stolen card stays stolen unless it goes back to its original owner.
+    def transfer(self, moves: list) -> Union[list, None]:
+        picked, chosen = set(), []
+        for from_user_id, card_name, _, _ in moves:
+            card = next((c for c in self.by_user.get(from_user_id, ()) if c['name'].lower() == card_name.lower() and c['unique_id'] not in picked), None)
+            if card is None: return None
+            picked.add(card['unique_id']); chosen.append(card)
+        moved = []
+        for card, (_, _, to_user_id, to_username) in zip(chosen, moves):
+            is_stolen = card['is_stolen'] and ORIGINAL_OWNERS.get(card['unique_id']) != to_user_id
+            self._discard(card['unique_id'])
+            self._insert(to_user_id, to_username, card['name'], is_stolen, card['unique_id'])
+            self.pending_ops += [['-', card['unique_id']], ['+', to_user_id, to_username, card['name'], 'True' if is_stolen else '', card['unique_id']]]
+            moved.append({"card_name": card['name'], "was_stolen": card['is_stolen'], "is_stolen": is_stolen})
+        return moved
+
+    def _take_pending(self) -> tuple:
+        ops, self.pending_ops = self.pending_ops, []
+        snapshot = self.snapshot_rows() if self.backend.wants_snapshot(ops, len(self.by_unique_id)) else None
+        return ops, snapshot
+
+    def flush(self):
+        ops, snapshot = self._take_pending()
+        try: self.backend.write_inventory(ops, snapshot)
+        except Exception:
+            self.pending_ops = ops + self.pending_ops
+            raise
+
+    async def flush_async(self):
+        ops, snapshot = self._take_pending()
+        if not ops and snapshot is None: return
+        try: await STORAGE_IO.run(self.backend.write_inventory, ops, snapshot)
+        except Exception:
+            self.pending_ops = ops + self.pending_ops
+            raise
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+INVENTORY_STORE = InventoryStore(STORAGE)
+
+# The helpers below are async for cluster workers, where the store lives with the coordinator. The local store never
+# awaits, so in a single process they still run without yielding and transaction code keeps its atomicity.
+async def add_card_to_inventory(user: discord.User, card_name: str, is_stolen: bool = False, unique_id: str = None) -> str:
     if unique_id is None:
-        unique_id = f"{card_name}-{datetime.now(timezone.utc).timestamp()}-{random.randint(1000,9999)}"
-    with open(INVENTORY_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([user.id, user.name, card_name, 'True' if is_stolen else '', unique_id])
+        unique_id = new_unique_id(card_name)
+    if CLUSTER_CLIENT: await INVENTORY_STORE.add(user.id, user.name, card_name, is_stolen, unique_id)
+    else: INVENTORY_STORE.add(user.id, user.name, card_name, is_stolen, unique_id)
     print(f"Added '{card_name}' (ID: {unique_id}, Stolen: {is_stolen}) to {user.name}'s inventory.")
     return unique_id
 
-def remove_card_from_inventory(user_id: int, card_name_to_remove: str) -> dict:
-    lines, card_removed, removed_card_data = [], False, None
-    try:
-        with open(INVENTORY_CSV_FILE, 'r', newline='', encoding='utf-8') as f_in: lines = list(csv.reader(f_in))
-    except FileNotFoundError: return None
-    new_lines = [lines[0]] if lines else []
-    for row in lines[1:]:
-        if not card_removed and len(row) >= 5 and str(user_id) == row[0] and card_name_to_remove.lower() == row[2].lower():
-            card_removed = True
-            removed_card_data = {"user_id": row[0], "username": row[1], "card_name": row[2], "is_stolen": row[3], "unique_id": row[4]}
+async def remove_card_from_inventory(user_id: int, card_name_to_remove: str) -> dict:
+    if CLUSTER_CLIENT: return await INVENTORY_STORE.remove(user_id, card_name_to_remove)
+    return INVENTORY_STORE.remove(user_id, card_name_to_remove)
+
+async def get_user_inventory(user_id: int) -> list:
+    if CLUSTER_CLIENT: return await INVENTORY_STORE.get(user_id)
+    return INVENTORY_STORE.get(user_id)
+
+# card name -> [clean, stolen]; don't mutate it
+async def get_user_card_counts(user_id: int) -> dict:
+    if CLUSTER_CLIENT: return await INVENTORY_STORE.card_counts(user_id)
+    return INVENTORY_STORE.card_counts(user_id)
+
+async def get_user_card_names(user_id: int, stealable_only: bool = False) -> NameIndex:
+    if CLUSTER_CLIENT: return await INVENTORY_STORE.names(user_id, stealable_only)
+    return INVENTORY_STORE.names(user_id, stealable_only)
+
+async def get_user_inventory_version(user_id: int) -> int:
+    if CLUSTER_CLIENT: return await INVENTORY_STORE.version(user_id)
+    return INVENTORY_STORE.version(user_id)
+
+async def transfer_cards(moves: list) -> Union[list, None]:
+    moved = await INVENTORY_STORE.transfer(moves) if CLUSTER_CLIENT else INVENTORY_STORE.transfer(moves)
+    if moved is not None: print(f"Transferred {len(moved)} card(s): " + ", ".join(f"'{name}' {a} -> {b}" for a, name, b, _ in moves))
+    return moved
+
+# --- Leaderboards ---
+LEADERBOARD_BOARDS = {"unique": "Unique Cards", "rarity": "Rarity Score", "steals": "Stolen Cards", "claims": "Cards Claimed"}
+LEADERBOARD_SIZE = 10
+
+def rarity_value(card_name: str) -> int:
+    return RARITY_VALUES.get(CARD_RARITY_MAP.get(card_name), 0)
+
+# Lazily cleaned max-heap: updates push a fresh entry, and top() drops the stale ones it passes
+class TopK:
+    __slots__ = ('scores', 'heap')
+    def __init__(self):
+        self.scores, self.heap = {}, []
+
+    def __len__(self) -> int: return len(self.scores)
+
+    def update(self, key, score: int):
+        if score <= 0:
+            if self.scores.pop(key, None) is None: return
+        elif self.scores.get(key) == score: return
         else:
-            new_lines.append(row)
-    if card_removed: safe_atomic_write_csv(INVENTORY_CSV_FILE, new_lines)
-    return removed_card_data
+            self.scores[key] = score; heapq.heappush(self.heap, (-score, key))
+        if len(self.heap) > 2 * len(self.scores) + 64:
+            self.heap = [(-score, key) for key, score in self.scores.items()]; heapq.heapify(self.heap)
+
+    def top(self, k: int) -> list:
+        live, seen = [], set()
+        while self.heap and len(live) < k:
+            entry = heapq.heappop(self.heap)
+            if entry[1] not in seen and self.scores.get(entry[1]) == -entry[0]: live.append(entry); seen.add(entry[1])
+        for entry in live: heapq.heappush(self.heap, entry)
+        return [(key, -negative) for negative, key in live]
+
+# Kept current as cards move and claims arrive, so leaderboards and card stats never scan an inventory or a log
+class Leaderboards:
+    def __init__(self):
+        self.user_scores = {}  # user_id -> [unique cards, rarity score, stolen cards held]
+        self.user_claims = defaultdict(int)  # user_id -> claims anywhere
+        self.cards = defaultdict(lambda: [0, 0, 0])  # card name -> [copies held, stolen copies, owners]
+        self.card_claims = defaultdict(int)  # card name -> claims anywhere
+        self.guild_claims = defaultdict(lambda: defaultdict(int))  # guild_id -> user_id -> claims there
+        self.guild_card_claims = defaultdict(lambda: defaultdict(int))  # guild_id -> card name -> claims there
+        self.user_guilds = defaultdict(set)  # user_id -> guilds they've claimed in
+        self.boards = {board: TopK() for board in LEADERBOARD_BOARDS}
+        self.guild_boards = defaultdict(lambda: {board: TopK() for board in LEADERBOARD_BOARDS})
+
+    def _publish(self, user_id: int):
+        unique, rarity, stolen = self.user_scores.get(user_id, (0, 0, 0))
+        for boards in (self.boards, *(self.guild_boards[guild_id] for guild_id in self.user_guilds.get(user_id, ()))):
+            boards["unique"].update(user_id, unique); boards["rarity"].update(user_id, rarity); boards["steals"].update(user_id, stolen)
+
+    def card_changed(self, user_id: int, card_name: str, is_stolen: bool, delta: int, copies_left: int):
+        scores, card = self.user_scores.setdefault(user_id, [0, 0, 0]), self.cards[card_name]
+        card[0] += delta
+        if is_stolen: scores[2] += delta; card[1] += delta
+        if copies_left == (1 if delta > 0 else 0): # first copy gained, or last copy gone
+            scores[0] += delta; scores[1] += delta * rarity_value(card_name); card[2] += delta
+        elif not is_stolen: return # another copy of a card they already had; no board moves
+        if not any(scores): del self.user_scores[user_id]
+        self._publish(user_id)
+
+    def rebuild(self, counts: dict):
+        self.user_scores, self.cards = {}, defaultdict(lambda: [0, 0, 0])
+        for boards in (self.boards, *self.guild_boards.values()):
+            for board in ("unique", "rarity", "steals"): boards[board] = TopK()
+        for user_id, cards in counts.items():
+            self.user_scores[user_id] = [len(cards), sum(map(rarity_value, cards)), sum(stolen for _, stolen in cards.values())]
+            for card_name, (kept, stolen) in cards.items():
+                card = self.cards[card_name]; card[0] += kept + stolen; card[1] += stolen; card[2] += 1
+            self._publish(user_id)
+
+    def record_claim(self, guild_id: int, user_id: int, card_name: str, count: int = 1):
+        self.card_claims[card_name] += count
+        self.user_claims[user_id] += count
+        self.boards["claims"].update(user_id, self.user_claims[user_id])
+        if guild_id is None: return # claims logged before servers were recorded only count globally
+        self.guild_card_claims[guild_id][card_name] += count
+        claims = self.guild_claims[guild_id]; claims[user_id] += count
+        self.guild_boards[guild_id]["claims"].update(user_id, claims[user_id])
+        if guild_id not in self.user_guilds[user_id]:
+            self.user_guilds[user_id].add(guild_id); self._publish(user_id)
+
+    def load_claims(self, totals: dict):
+        for (guild_id, user_id, card_name), count in totals.items(): self.record_claim(guild_id, user_id, card_name, count)
+
+    def top(self, board: str, guild_id: int = None, k: int = LEADERBOARD_SIZE) -> list:
+        boards = self.boards if guild_id is None else self.guild_boards.get(guild_id)
+        return boards[board].top(k) if boards else []
+
+    def card_stats(self, card_name: str, guild_id: int = None) -> dict:
+        copies, stolen, owners = self.cards.get(card_name, (0, 0, 0))
+        return {"copies": copies, "stolen": stolen, "owners": owners, "claims": self.card_claims.get(card_name, 0),
+                "server_claims": self.guild_card_claims[guild_id].get(card_name, 0) if guild_id in self.guild_card_claims else 0}
+
+LEADERBOARDS = Leaderboards()
+
+# Queued on the storage thread before the bot can receive a claim, so no claim is counted twice
+async def load_claim_stats():
+    start = time.perf_counter()
+    try: totals = await STORAGE_IO.run(STORAGE.claim_totals)
+    except Exception:
+        print("--- FAILED TO LOAD CLAIM STATS ---"); traceback.print_exc(); return
+    LEADERBOARDS.load_claims(totals)
+    print(f"Loaded claim stats for {len(LEADERBOARDS.guild_claims)} server(s) in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+async def query_leaderboard(board: str, guild_id: int = None) -> list:
+    if CLUSTER_CLIENT: return [tuple(entry) for entry in await CLUSTER_CLIENT.call("leaderboard", board, guild_id)]
+    return LEADERBOARDS.top(board, guild_id)
+
+async def query_card_stats(card_name: str, guild_id: int = None) -> dict:
+    if CLUSTER_CLIENT: return await CLUSTER_CLIENT.call("card_stats", card_name, guild_id)
+    return LEADERBOARDS.card_stats(card_name, guild_id)
+
+# --- Transactions ---
+# Keys are taken in sorted order, so transactions sharing a key queue up instead of deadlocking
+class TransactionLocks:
+    def __init__(self):
+        self.locks = {}  # key -> [asyncio.Lock, number of transactions holding or waiting]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, users=(), spawns=()):
+        keys = sorted({("spawn", spawn_id) for spawn_id in spawns} | {("user", user_id) for user_id in users})
+        registered, locked = [], []
+        try:
+            for key in keys:
+                entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1; registered.append(key)
+                await entry[0].acquire(); locked.append(key)
+            yield
+        finally:
+            for key in reversed(locked): self.locks[key][0].release()
+            for key in registered:
+                entry = self.locks[key]; entry[1] -= 1
+                if not entry[1]: del self.locks[key]
+
+TRANSACTIONS = TransactionLocks()
+
+# --- Rate Limits ---
+RATE_LIMIT_SNAPSHOT_SECONDS = 60
+
+# Sliding window per key on the monotonic clock; `persist` limiters are snapshotted to RATE_LIMITS_FILE
+class RateLimiter:
+    __slots__ = ('limit', 'window', 'persist', 'hits', 'changes', 'clock')
+    def __init__(self, limit: int, window: float, persist: bool = False, clock=time.monotonic):
+        self.limit, self.window, self.persist, self.clock = limit, window, persist, clock
+        self.hits = {}  # key -> deque of its hit times within the window, oldest first
+        self.changes = 0  # bumped on every recorded hit, so snapshots can skip unchanged limiters
+
+    # 0, or the seconds until `key` is under its limit again
+    def hit(self, key) -> float:
+        now = self.clock()
+        if (hits := self.hits.get(key)) is None: hits = self.hits[key] = deque(maxlen=self.limit)
+        while hits and hits[0] <= now - self.window: hits.popleft()
+        if len(hits) >= self.limit: return hits[0] + self.window - now
+        hits.append(now); self.changes += 1
+        return 0.0
+
+    def prune(self):
+        cutoff = self.clock() - self.window
+        for key in [key for key, hits in self.hits.items() if not hits or hits[-1] <= cutoff]: del self.hits[key]
+
+    def snapshot(self) -> dict:
+        offset, cutoff = time.time() - self.clock(), self.clock() - self.window
+        return {str(key): [t + offset for t in hits if t > cutoff] for key, hits in self.hits.items() if hits and hits[-1] > cutoff}
+
+    def restore(self, key, wall_times):
+        offset, hits = time.time() - self.clock(), self.hits.setdefault(key, deque(maxlen=self.limit))
+        hits.extend(sorted(t - offset for t in wall_times if t - offset > self.clock() - self.window))
+
+RATE_LIMITS = {
+    "steal": RateLimiter(STEAL_LIMIT, STEAL_COOLDOWN_HOURS * 3600, persist=True),  # per server
+    "guess": RateLimiter(GUESS_LIMIT, GUESS_WINDOW_SECONDS),  # per user, wrong guesses across every spawn
+    "spawn": RateLimiter(SPAWN_COMMAND_LIMIT, SPAWN_COMMAND_WINDOW_SECONDS),  # per server, /spawn and /spawn_card
+}
+RATE_LIMITS_SAVED = None # RateLimiter.changes per limiter as of the last snapshot; None until load_rate_limits runs
+
+def retry_time(seconds: float) -> str:
+    return f"<t:{int(time.time() + seconds) + 1}:R>"
+
+def rate_limit_snapshot() -> dict:
+    return {name: limiter.snapshot() for name, limiter in RATE_LIMITS.items() if limiter.persist}
 
-def get_user_inventory(user_id: int) -> list:
-    inventory = []
+# Also moves steal times still kept in server configs into the steal limiter
+def load_rate_limits():
+    global RATE_LIMITS_SAVED
     try:
-        with open(INVENTORY_CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('user_id') and row['user_id'].strip().isdigit() and int(row['user_id']) == user_id:
-                    is_stolen_raw = row.get('is_stolen')
-                    is_stolen_value = is_stolen_raw.strip().lower() == 'true' if is_stolen_raw else False
-                    inventory.append({"name": row['card_name'], "is_stolen": is_stolen_value, "unique_id": row.get('unique_id')})
-    except (FileNotFoundError, ValueError, KeyError): return []
-    return inventory
-
-def log_original_owner(unique_id: str, owner_id: int):
-    with open(STEAL_LOG_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([unique_id, owner_id])
-
-def get_original_owner(unique_id: str) -> int:
+        with open(RATE_LIMITS_FILE, 'r') as f: saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): saved = {}
+    for name, windows in saved.items():
+        if name in RATE_LIMITS:
+            for key, wall_times in windows.items(): RATE_LIMITS[name].restore(int(key), wall_times)
+    for guild_id_str, config in list(SERVER_CONFIGS.items()):
+        if 'steal_timestamps' in config and owns_guild(guild_id_str):
+            stamps = [datetime.fromisoformat(t).timestamp() for t in config.pop('steal_timestamps')]
+            RATE_LIMITS["steal"].restore(int(guild_id_str), stamps); mark_config_dirty(guild_id_str)
+    RATE_LIMITS_SAVED = {name: limiter.changes for name, limiter in RATE_LIMITS.items()}
+
+# None unless a persisted limiter changed since the last snapshot
+def save_rate_limits(force: bool = False) -> Union[dict, None]:
+    global RATE_LIMITS_SAVED
+    if RATE_LIMITS_SAVED is None: return None # never loaded, e.g. in the cluster coordinator; don't clobber the file
+    changes = {name: limiter.changes for name, limiter in RATE_LIMITS.items()}
+    if not force and all(changes[name] == RATE_LIMITS_SAVED[name] for name, limiter in RATE_LIMITS.items() if limiter.persist): return None
+    RATE_LIMITS_SAVED = changes
+    return rate_limit_snapshot()
+
+# --- Card Art Cache ---
+ASSET_CACHE_MAX_BYTES = int(os.environ.get('ASSET_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+ASSET_CACHE_PRELOAD = os.environ.get('ASSET_CACHE_PRELOAD', '1') != '0' # Warm the cache with every card's art at startup
+
+# LRU under a byte budget; files bigger than the whole budget are served from disk
+class AssetCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes, self.size = max_bytes, 0
+        self.entries = OrderedDict() # path -> bytes, least recently used first
+        self.hits = self.misses = 0
+        self.lock = threading.Lock() # preload fills the cache from an executor thread
+
+    def _read(self, path: str) -> bytes:
+        with open(path, 'rb') as f: return f.read()
+
+    def _store(self, path: str, data: bytes):
+        if len(data) > self.max_bytes: return
+        with self.lock:
+            if path in self.entries: return
+            self.entries[path] = data; self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False); self.size -= len(evicted)
+
+    async def get(self, path: str) -> bytes:
+        with self.lock:
+            data = self.entries.get(path)
+            if data is not None:
+                self.entries.move_to_end(path); self.hits += 1
+                return data
+            self.misses += 1
+        data = await asyncio.get_running_loop().run_in_executor(None, self._read, path) # a miss never reads on the event loop
+        self._store(path, data)
+        return data
+
+    # BytesIO shares the immutable buffer rather than copying it
+    async def file(self, path: str) -> discord.File:
+        return discord.File(io.BytesIO(await self.get(path)), filename=os.path.basename(path))
+
+    def preload(self, paths) -> int:
+        loaded = 0
+        for path in paths:
+            if self.size >= self.max_bytes: break
+            with self.lock:
+                if path in self.entries: continue
+            try: self._store(path, self._read(path)); loaded += 1
+            except OSError as e: print(f"Could not preload '{path}': {e}")
+        return loaded
+
+    def discard(self, path: str):
+        with self.lock:
+            if (data := self.entries.pop(path, None)) is not None: self.size -= len(data)
+
+    def clear(self):
+        with self.lock: self.entries.clear(); self.size = 0
+
+ASSET_CACHE = AssetCache(ASSET_CACHE_MAX_BYTES)
+
+async def preload_card_art(cards=None):
+    if not ASSET_CACHE_PRELOAD: return
+    cards = ALL_CARDS if cards is None else cards
+    # Thumbnails first: every spawn sends one, while full art is only needed on claims and /card view
+    paths = [card.thumb_path for card in cards] + [card.full_path for card in cards]
+    loaded = await asyncio.get_running_loop().run_in_executor(None, ASSET_CACHE.preload, paths)
+    print(f"Preloaded {loaded} card images ({ASSET_CACHE.size / 1024 / 1024:.1f} MB cached).")
+
+# --- Attachment URL Reuse ---
+ATTACHMENT_URL_TTL_SECONDS = 12 * 3600 # Used when an uploaded URL carries no expiry of its own
+ATTACHMENT_URL_EXPIRY_MARGIN_SECONDS = 3600 # Stop reusing a signed URL this long before Discord expires it
+ATTACHMENT_URL_REVALIDATE_SECONDS = 3600 # A reused URL is checked with a HEAD request at most this often
+ATTACHMENT_URL_CHECK_TIMEOUT_SECONDS = 5
+
+# CDN URLs of uploaded card art, reused until shortly before their signed `ex` expiry and re-checked with HEAD
+class AttachmentUrlCache:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.entries = {} # path -> [url, expires_at, validated_at]
+        self.hits = self.misses = 0
+        self.session = None # one aiohttp session for every HEAD check, opened on first use
+
+    def expiry_of(self, url: str) -> float:
+        now = self.clock()
+        try: expires = int(parse_qs(urlparse(url).query)['ex'][0], 16)
+        except (KeyError, IndexError, ValueError): return now + ATTACHMENT_URL_TTL_SECONDS
+        return min(expires - ATTACHMENT_URL_EXPIRY_MARGIN_SECONDS, now + ATTACHMENT_URL_TTL_SECONDS)
+
+    def record(self, path: str, message) -> Union[str, None]:
+        message = getattr(message, 'resource', message) # interaction responses wrap the message
+        url = next((embed.image.url for embed in getattr(message, 'embeds', []) if embed.image.url), None)
+        if not url: url = next((a.url for a in getattr(message, 'attachments', []) if a.filename == os.path.basename(path)), None)
+        if not url: return None
+        self.entries[path] = [url, self.expiry_of(url), self.clock()]
+        return url
+
+    def invalidate(self, path: str = None):
+        if path is None: self.entries.clear()
+        else: self.entries.pop(path, None)
+
+    async def validate(self, url: str) -> bool:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=ATTACHMENT_URL_CHECK_TIMEOUT_SECONDS))
+        try:
+            async with self.session.head(url, allow_redirects=True) as response: return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError): return False
+
+    async def close(self):
+        if self.session is not None: await self.session.close(); self.session = None
+
+    async def get(self, path: str) -> Union[str, None]:
+        entry, now = self.entries.get(path), self.clock()
+        if entry and now < entry[1]:
+            if now - entry[2] < ATTACHMENT_URL_REVALIDATE_SECONDS or await self.validate(entry[0]):
+                entry[2] = now; self.hits += 1
+                return entry[0]
+        self.entries.pop(path, None); self.misses += 1
+        return None
+
+ATTACHMENT_URLS = AttachmentUrlCache()
+
+async def send_card_art(send, embed: discord.Embed, path: str, **kwargs):
+    if url := await ATTACHMENT_URLS.get(path):
+        embed.set_image(url=url)
+        return await send(embed=embed, **kwargs)
+    picture = await ASSET_CACHE.file(path)
+    embed.set_image(url=f"attachment://{picture.filename}")
+    message = await send(embed=embed, file=picture, **kwargs)
+    if message is not None: ATTACHMENT_URLS.record(path, message)
+    return message
+
+def log_original_owner(unique_id: str, owner_id: int, wait: bool = False) -> asyncio.Future:
+    ORIGINAL_OWNERS.setdefault(unique_id, owner_id)
+    return STORAGE_IO.submit('log_original_owners', (unique_id, owner_id), wait)
+
+async def get_original_owner(unique_id: str) -> int:
     if not unique_id: return None
-    try:
-        with open(STEAL_LOG_CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('unique_id') == unique_id:
-                    return int(row.get('original_owner_id'))
-    except (FileNotFoundError, KeyError, ValueError): return None
-    return None
+    if CLUSTER_CLIENT: return await ORIGINAL_OWNERS.get(unique_id)
+    return ORIGINAL_OWNERS.get(unique_id)
+
+# --- Steal Odds ---
+def compute_base_steal_chance(leverage_prefix: str, target_prefix: str) -> float:
+    target_value = RARITY_VALUES.get(target_prefix, 0)
+    if leverage_prefix in UNDERDOG_STEAL_CHANCES and target_value >= RARITY_VALUES["L"]:
+        return UNDERDOG_STEAL_CHANCES[leverage_prefix]
+    diff = RARITY_VALUES.get(leverage_prefix, 0) - target_value
+    calculated_chance = BASE_STEAL_CHANCE
+    if diff > 0:
+        calculated_chance += (diff / MAX_RARITY_VALUE_DIFFERENCE) * (MAX_NORMAL_STEAL_CHANCE - BASE_STEAL_CHANCE)
+    elif diff < 0:
+        calculated_chance -= (abs(diff) / MAX_RARITY_VALUE_DIFFERENCE) * (BASE_STEAL_CHANCE - MIN_STEAL_CHANCE)
+    return max(MIN_STEAL_CHANCE, min(calculated_chance, MAX_NORMAL_STEAL_CHANCE))
+
+# target rarity -> {leverage rarity -> base chance}; None stands in for any prefix missing from RARITY_VALUES
+STEAL_CHANCE_TABLE = {target: {leverage: compute_base_steal_chance(leverage, target) for leverage in [*RARITY_VALUES, None]}
+                      for target in [*RARITY_VALUES, None]}
+
+def _rarity_key(card_name: str) -> Union[str, None]:
+    prefix = CARD_RARITY_MAP.get(card_name)
+    return prefix if prefix in RARITY_VALUES else None
+
+def steal_odds(thief_id: int, target_card: dict, original_owner_id: int, leverage_names) -> tuple:
+    row = STEAL_CHANCE_TABLE[_rarity_key(target_card['name'])]
+    owner_bonus = original_owner_id == thief_id
+    bonus = STOLEN_BONUS_CHANCE if owner_bonus else 0.0
+    return {name: min(row[_rarity_key(name)] + bonus, ABSOLUTE_MAX_STEAL_CHANCE) for name in leverage_names}, owner_bonus
 
 # --- 3. CORE LOADING FUNCTIONS ---
+# The first logged owner wins
+def load_original_owners():
+    for unique_id, owner_id in STORAGE.iter_original_owners():
+        ORIGINAL_OWNERS.setdefault(unique_id, owner_id)
+    print(f"Indexed original owners for {len(ORIGINAL_OWNERS)} card(s).")
+
 def load_spawn_history():
     global RECENTLY_SPAWNED
-    try:
-        with open(SPAWN_HISTORY_CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('guild_id') and row.get('card_name'):
-                    RECENTLY_SPAWNED[int(row['guild_id'])].append(row['card_name'])
-        print(f"Loaded spawn history for {len(RECENTLY_SPAWNED)} server(s).")
-    except (FileNotFoundError, KeyError, ValueError): print("No spawn history file found.")
-
-def load_cards():
-    print("Loading and verifying cards...")
-    if not all(os.path.isdir(p) for p in [CARDS_PATH, THUMBNAILS_PATH]):
-        print(f"FATAL ERROR: 'cards' or 'thumbnails' directory not found."); return
-    for filename in os.listdir(CARDS_PATH):
-        if not (filename.endswith(".png") and '_' in filename): continue
-        if filename not in CARD_ANSWERS: continue
-        
-        full_path = os.path.join(CARDS_PATH, filename)
-        thumb_path = os.path.join(THUMBNAILS_PATH, f"{filename.replace('.png', '')}_thumb.png")
-
-        if not os.path.exists(full_path):
-            continue
-            
-        if not os.path.exists(thumb_path):
-            print(f"  [MISSING THUMBNAIL] Skipping '{filename}'. Expected thumbnail not found at: {thumb_path}")
-            continue
-
-        prefix, answers, main_name = filename.split('_', 1)[0], CARD_ANSWERS[filename], CARD_ANSWERS[filename][0]
-        weight = PREFIX_WEIGHTS.get(prefix, 1)
-        card_info = {"main_name": main_name, "all_answers": answers, "weight": weight, "full_path": full_path, "thumb_path": thumb_path}
-        ALL_CARDS.append(card_info)
-        CARD_RARITY_MAP[main_name] = prefix
-    print(f"Successfully loaded and verified {len(ALL_CARDS)} card files.")
-
-def load_prefix_weights():
+    for guild_id, card_name in STORAGE.recent_spawns(RECENT_SPAWN_MEMORY):
+        RECENTLY_SPAWNED[guild_id].append(card_name)
+    print(f"Loaded spawn history for {len(RECENTLY_SPAWNED)} server(s).")
+
+# --- Card Catalog ---
+CATALOG_WATCH_SECONDS = 30 # How often the card files are checked for changes
+
+class CardRecord:
+    __slots__ = ('main_name', 'all_answers', 'weight', 'prefix', 'full_path', 'thumb_path')
+    def __init__(self, main_name: str, all_answers: tuple, weight: int, prefix: str, full_path: str, thumb_path: str):
+        for slot, value in zip(self.__slots__, (main_name, all_answers, weight, prefix, full_path, thumb_path)): object.__setattr__(self, slot, value)
+    def __setattr__(self, name, value): raise AttributeError("CardRecord is read-only")
+    def __repr__(self): return f"CardRecord({self.main_name!r}, {self.prefix!r})"
+
+# Immutable: compile_card_catalog builds one off the event loop and install_catalog swaps it in whole
+class CardCatalog:
+    __slots__ = ('version', 'signature', 'cards', 'answers', 'prefix_weights', 'rarity_map', 'by_lower_name',
+                 'cumulative', 'indices_by_name', 'name_index', 'file_stamps')
+    def __init__(self, version: int, signature: tuple, cards: list, answers: dict, prefix_weights: dict, file_stamps: dict):
+        indices_by_name = defaultdict(list)
+        for index, card in enumerate(cards): indices_by_name[card.main_name].append(index)
+        fields = {
+            'version': version, 'signature': signature, 'cards': tuple(cards),
+            'answers': MappingProxyType(answers), 'prefix_weights': MappingProxyType(prefix_weights),
+            'rarity_map': MappingProxyType({card.main_name: card.prefix for card in cards}),
+            'by_lower_name': MappingProxyType({card.main_name.lower(): card for card in reversed(cards)}), # first card wins
+            'cumulative': tuple(itertools.accumulate(card.weight for card in cards)),
+            'indices_by_name': MappingProxyType({name: tuple(indices) for name, indices in indices_by_name.items()}),
+            'name_index': NameIndex(card.main_name for card in cards),
+            'file_stamps': MappingProxyType(file_stamps), # art path -> (mtime_ns, size) when compiled
+        }
+        for slot, value in fields.items(): object.__setattr__(self, slot, value)
+    def __setattr__(self, name, value): raise AttributeError("CardCatalog is read-only")
+
+def read_prefix_weights() -> dict:
     print(f"Loading weights from {PREFIX_WEIGHTS_CSV_FILE}...")
+    weights = {}
     try:
         with open(PREFIX_WEIGHTS_CSV_FILE, mode='r', encoding='utf-8') as infile:
             reader = csv.reader(infile); next(reader)
             for row in reader:
                 prefix, weight_str = row
-                try: PREFIX_WEIGHTS[prefix.strip()] = int(weight_str)
+                try: weights[prefix.strip()] = int(weight_str)
                 except ValueError: print(f"Warning: Bad weight for prefix '{prefix}'.")
-        print(f"Loaded weights for {len(PREFIX_WEIGHTS)} prefixes.")
+        print(f"Loaded weights for {len(weights)} prefixes.")
     except FileNotFoundError: print(f"FATAL ERROR: '{PREFIX_WEIGHTS_CSV_FILE}' not found.")
+    return weights
 
-def load_card_names():
+def read_card_names() -> dict:
     print(f"Loading names from {CARD_NAMES_CSV_FILE}...")
+    answers_by_file = {}
     try:
         with open(CARD_NAMES_CSV_FILE, mode='r', encoding='utf-8') as infile:
             reader = csv.reader(infile); next(reader)
             for row in reader:
-                filename, answers = row[0].strip(), [ans.strip() for ans in row[1:] if ans.strip()]
-                if filename and answers: CARD_ANSWERS[filename] = answers
-        print(f"Loaded names for {len(CARD_ANSWERS)} cards.")
+                if not row: continue
+                filename, answers = row[0].strip(), tuple(ans.strip() for ans in row[1:] if ans.strip())
+                if filename and answers: answers_by_file[filename] = answers
+        print(f"Loaded names for {len(answers_by_file)} cards.")
     except FileNotFoundError: print(f"FATAL ERROR: '{CARD_NAMES_CSV_FILE}' not found.")
+    return answers_by_file
+
+# None means scan the raw folders
+def load_asset_manifest() -> Union[dict, None]:
+    try:
+        with open(ASSET_MANIFEST_FILE, 'r', encoding='utf-8') as f: manifest = json.load(f)
+        return {filename: (os.path.join(ASSETS_PATH, entry['full']), os.path.join(ASSETS_PATH, entry['thumb']))
+                for filename, entry in manifest['cards'].items()}
+    except FileNotFoundError: return None
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        print(f"WARNING: '{ASSET_MANIFEST_FILE}' is unreadable ({e}); falling back to the raw card folders."); return None
+
+def iter_card_files():
+    if (manifest := load_asset_manifest()) is not None:
+        print(f"Using asset manifest with {len(manifest)} cards.")
+        for filename in sorted(manifest): yield filename, *manifest[filename]
+        if not os.path.isdir(CARDS_PATH): return
+    elif not all(os.path.isdir(p) for p in [CARDS_PATH, THUMBNAILS_PATH]):
+        print(f"FATAL ERROR: 'cards' or 'thumbnails' directory not found."); return
+    # Cards added since the last build_assets.py run are served from the raw folders until the next one.
+    unbuilt = [filename for filename in sorted(os.listdir(CARDS_PATH)) if filename.endswith(".png") and '_' in filename and filename not in (manifest or ())]
+    if manifest is not None and unbuilt:
+        print(f"WARNING: {len(unbuilt)} card(s) not in the asset manifest, loaded from '{CARDS_PATH}': {', '.join(unbuilt)}. Rerun build_assets.py.")
+    for filename in unbuilt:
+        yield filename, os.path.join(CARDS_PATH, filename), os.path.join(THUMBNAILS_PATH, f"{filename.replace('.png', '')}_thumb.png")
+
+def file_stamp(path: str) -> Union[tuple, None]:
+    try: st = os.stat(path)
+    except OSError: return None
+    return st.st_mtime_ns, st.st_size
+
+def catalog_signature() -> tuple:
+    stamps = [(path, file_stamp(path)) for path in (CARD_NAMES_CSV_FILE, PREFIX_WEIGHTS_CSV_FILE, ASSET_MANIFEST_FILE)]
+    for folder in (CARDS_PATH, THUMBNAILS_PATH):
+        try: stamps += sorted((entry.path, (entry.stat().st_mtime_ns, entry.stat().st_size)) for entry in os.scandir(folder))
+        except OSError: stamps.append((folder, None))
+    return tuple(stamps)
+
+# File I/O only, so it can run on a worker thread
+def compile_card_catalog(version: int, signature: tuple = None) -> CardCatalog:
+    signature = catalog_signature() if signature is None else signature
+    prefix_weights, answers_by_file = read_prefix_weights(), read_card_names()
+    print("Loading and verifying cards...")
+    cards, file_stamps = [], {}
+    for filename, full_path, thumb_path in iter_card_files():
+        if filename not in answers_by_file: continue
+
+        if (full_stamp := file_stamp(full_path)) is None:
+            continue
+            
+        if (thumb_stamp := file_stamp(thumb_path)) is None:
+            print(f"  [MISSING THUMBNAIL] Skipping '{filename}'. Expected thumbnail not found at: {thumb_path}")
+            continue
 
-def log_card_claim(user: discord.User, card_name: str):
-    with open(CLAIMS_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([datetime.now(timezone.utc).isoformat(), user.id, user.name, card_name])
+        prefix, answers = filename.split('_', 1)[0], answers_by_file[filename]
+        cards.append(CardRecord(answers[0], answers, prefix_weights.get(prefix, 1), prefix, full_path, thumb_path))
+        file_stamps[full_path], file_stamps[thumb_path] = full_stamp, thumb_stamp
+    print(f"Successfully loaded and verified {len(cards)} card files.")
+    return CardCatalog(version, signature, cards, answers_by_file, prefix_weights, file_stamps)
+
+# No awaits, so no coroutine sees a mix of old and new. Returns the cards whose art changed.
+def install_catalog(catalog: CardCatalog) -> list:
+    global CATALOG, ALL_CARDS, CARD_ANSWERS, PREFIX_WEIGHTS, CARD_RARITY_MAP, CARD_CATALOG_VERSION
+    previous = CATALOG
+    CATALOG, CARD_CATALOG_VERSION = catalog, catalog.version
+    ALL_CARDS, CARD_ANSWERS, PREFIX_WEIGHTS, CARD_RARITY_MAP = catalog.cards, catalog.answers, catalog.prefix_weights, catalog.rarity_map
+    if previous is None: return list(catalog.cards)
+    for path, stamp in previous.file_stamps.items():
+        if catalog.file_stamps.get(path) != stamp: ASSET_CACHE.discard(path); ATTACHMENT_URLS.invalidate(path)
+    if dict(previous.rarity_map) != dict(catalog.rarity_map): INVENTORY_STORE.rarities_changed()
+    # SPAWN_SAMPLER notices the version bump itself and rebuilds each guild's weights on that guild's next spawn.
+    return [card for card in catalog.cards if previous.file_stamps.get(card.full_path) != catalog.file_stamps[card.full_path]
+            or previous.file_stamps.get(card.thumb_path) != catalog.file_stamps[card.thumb_path]]
+
+CATALOG_RELOAD_LOCK = asyncio.Lock()
+# A compile that finds no cards never replaces a working catalog
+async def reload_catalog(force: bool = False) -> Union[CardCatalog, None]:
+    async with CATALOG_RELOAD_LOCK:
+        loop = asyncio.get_running_loop()
+        signature = await loop.run_in_executor(None, catalog_signature)
+        if CATALOG is not None and not force and signature == CATALOG.signature: return None
+        catalog = await loop.run_in_executor(None, compile_card_catalog, CARD_CATALOG_VERSION + 1, signature)
+        if not catalog.cards and CATALOG is not None and CATALOG.cards:
+            print("WARNING: The recompiled card catalog is empty; keeping the current one."); return None
+        changed = install_catalog(catalog)
+        print(f"Installed card catalog v{catalog.version} ({len(catalog.cards)} cards, {len(changed)} with new art).")
+    await preload_card_art(changed) # Warm the art that changed so the first spawn of it doesn't pay for a disk read
+    return catalog
+
+@tasks.loop(seconds=CATALOG_WATCH_SECONDS)
+async def catalog_watcher():
+    try: await reload_catalog()
+    except Exception as e: print(f"Card catalog reload failed: {e}")
+
+# The log helpers queue their record and return at once; with wait=True they return a future to await for durability
+def log_card_claim(user: discord.User, card_name: str, guild_id: int = None, wait: bool = False) -> asyncio.Future:
+    future = STORAGE_IO.submit('log_claims', (datetime.now(timezone.utc).isoformat(), user.id, user.name, card_name, guild_id), wait)
+    if CLUSTER_CLIENT is None: LEADERBOARDS.record_claim(guild_id, user.id, card_name) # the coordinator counts workers' claims
     print(f"Logged claim: {user.name} claimed {card_name}")
+    return future
 
-def log_spawn(guild_id: int, card_name: str):
-    with open(SPAWN_HISTORY_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        csv.writer(f).writerow([datetime.now(timezone.utc).isoformat(), guild_id, card_name])
+def log_spawn(guild_id: int, card_name: str, wait: bool = False) -> asyncio.Future:
+    now = datetime.now(timezone.utc)
+    future = STORAGE_IO.submit('log_spawns', (now.isoformat(), guild_id, card_name), wait)
+    DAILY_SPAWN_COUNTS.record(guild_id, card_name, now)
     print(f"Logged spawn: '{card_name}' in guild {guild_id}")
+    return future
 
 # --- 4. DISCORD UI COMPONENTS ---
-class ApprovalView(ui.View):
+class ApprovalView(TimedView):
     def __init__(self):
         super().__init__(timeout=None)
 
@@ -247,7 +1638,7 @@ class ApprovalView(ui.View):
             await interaction.response.send_message("Error: Could not find a valid Guild ID in the message.", ephemeral=True); return
 
         SERVER_CONFIGS.setdefault(guild_id_str, {})['is_approved'] = True
-        save_configs()
+        await save_configs_async([guild_id_str]); SPAWN_SCHEDULER.schedule(guild_id_str)
         for item in self.children: item.disabled = True
         await interaction.response.edit_message(content=f"✅ Server `{guild_id_str}` has been **approved**.", view=self)
 
@@ -272,7 +1663,7 @@ class ApprovalView(ui.View):
             print(f"Denied and left guild {guild_id_str}.")
         if guild_id_str in SERVER_CONFIGS:
             del SERVER_CONFIGS[guild_id_str]
-            save_configs()
+            await save_configs_async([guild_id_str]); SPAWN_SCHEDULER.schedule(guild_id_str)
         for item in self.children: item.disabled = True
         await interaction.response.edit_message(content=f"❌ Server `{guild_id_str}` has been **denied** and the bot has left.", view=self)
 
@@ -280,29 +1671,32 @@ class GuessingModal(ui.Modal, title="Guess the Card!"):
     def __init__(self, spawn_view):
         super().__init__(); self.spawn_view = spawn_view
     guess = ui.TextInput(label="Card Name", placeholder="Type your guess here...")
+    @timed("view_callback_seconds", view="GuessingModal", item="on_submit")
     async def on_submit(self, interaction: discord.Interaction):
         user_guess = self.guess.value.strip().lower()
         if user_guess in self.spawn_view.correct_answers_list:
-            if self.spawn_view.claimed:
+            async with TRANSACTIONS.hold(users=(interaction.user.id,), spawns=(id(self.spawn_view),)):
+                if not (beaten := self.spawn_view.claimed):
+                    self.spawn_view.claimed = True; self.spawn_view.stop()
+                    main_name = self.spawn_view.main_display_name
+                    unique_id = await add_card_to_inventory(interaction.user, main_name, is_stolen=False)
+                    log_card_claim(interaction.user, main_name, interaction.guild_id); log_original_owner(unique_id, interaction.user.id)
+            if beaten:
                 await interaction.response.send_message("Someone just beat you to it!", ephemeral=True); return
-            self.spawn_view.claimed = True; self.spawn_view.stop()
             for child in self.spawn_view.children: child.disabled = True
             await self.spawn_view.message.edit(view=self.spawn_view)
-            main_name = self.spawn_view.main_display_name
             await interaction.response.send_message(f"✅ Correct! {interaction.user.mention} guessed **{main_name}**!", ephemeral=True)
-            log_card_claim(interaction.user, main_name)
-            unique_id = add_card_to_inventory(interaction.user, main_name, is_stolen=False)
-            log_original_owner(unique_id, interaction.user.id)
             embed = discord.Embed(title="Card Claimed!", description=f"**{main_name}** was claimed by {interaction.user.mention}!", color=discord.Color.green())
-            with open(self.spawn_view.full_card_path, 'rb') as f:
-                await interaction.channel.send(content=interaction.user.mention, embed=embed, file=discord.File(f))
+            await send_card_art(interaction.channel.send, embed, self.spawn_view.full_card_path, content=interaction.user.mention)
         else:
+            if wait := RATE_LIMITS["guess"].hit(interaction.user.id): # only wrong guesses count, so a right one is never refused
+                await interaction.response.send_message(f"You're guessing too fast. Try again {retry_time(wait)}.", ephemeral=True); return
             self.spawn_view.guessers[interaction.user.id] += 1
             tries_left = 3 - self.spawn_view.guessers[interaction.user.id]
             msg = f"❌ That's not it. You have {tries_left} tries left." if tries_left > 0 else f"❌ Last try. You are locked out."
             await interaction.response.send_message(msg, ephemeral=True)
 
-class SpawnView(ui.View):
+class SpawnView(TimedView):
     def __init__(self, main_display_name: str, correct_answers_list: list, full_card_path: str):
         super().__init__(timeout=120.0)
         self.main_display_name, self.correct_answers_list, self.full_card_path = main_display_name, [a.lower() for a in correct_answers_list], full_card_path
@@ -318,11 +1712,11 @@ class SpawnView(ui.View):
         embed = discord.Embed(title="Card Despawned!", description=f"Nobody claimed **{self.main_display_name}** in time.", color=discord.Color.light_grey())
         if self.message: await self.message.edit(embed=embed, view=self)
 
-class StealConfirmView(ui.View):
+class StealConfirmView(TimedView):
     def __init__(self, thief: discord.Member, victim: discord.Member, target_card: dict, leveraged_card: dict, interaction: discord.Interaction):
         super().__init__(timeout=60.0)
         self.thief, self.victim, self.target_card, self.leveraged_card = thief, victim, target_card, leveraged_card
-        self.original_interaction = interaction
+        self.original_interaction, self.resolved = interaction, False
     async def on_timeout(self):
         for item in self.children: item.disabled = True
         try: await self.original_interaction.edit_original_response(content="Steal attempt timed out.", view=self)
@@ -331,103 +1725,56 @@ class StealConfirmView(ui.View):
     async def confirm(self, interaction: discord.Interaction, button: ui.Button):
         if interaction.user.id != self.thief.id:
             await interaction.response.send_message("This is not your decision.", ephemeral=True); return
+        async with TRANSACTIONS.hold(users=(self.thief.id, self.victim.id)):
+            if not (already_resolved := self.resolved):
+                self.resolved = True
+                embed = await self.resolve()
+        if already_resolved:
+            await interaction.response.send_message("This steal attempt has already been resolved.", ephemeral=True); return
         for item in self.children: item.disabled = True
         await interaction.response.edit_message(view=self)
-        
-        leverage_prefix = CARD_RARITY_MAP.get(self.leveraged_card['name'])
-        target_prefix = CARD_RARITY_MAP.get(self.target_card['name'])
-        target_value = RARITY_VALUES.get(target_prefix, 0)
-        
-        base_chance = 0.0
-
-        if leverage_prefix == "R" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 5.0
-        elif leverage_prefix == "UR" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 15.0
-        elif leverage_prefix == "SR" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 20.0
-        else:
-            leverage_value = RARITY_VALUES.get(leverage_prefix, 0)
-            diff = leverage_value - target_value
-            
-            calculated_chance = BASE_STEAL_CHANCE
-            if diff > 0:
-                advantage_range = MAX_NORMAL_STEAL_CHANCE - BASE_STEAL_CHANCE
-                calculated_chance += (diff / MAX_RARITY_VALUE_DIFFERENCE) * advantage_range
-            elif diff < 0:
-                disadvantage_range = BASE_STEAL_CHANCE - MIN_STEAL_CHANCE
-                calculated_chance -= (abs(diff) / MAX_RARITY_VALUE_DIFFERENCE) * disadvantage_range
-            base_chance = max(MIN_STEAL_CHANCE, min(calculated_chance, MAX_NORMAL_STEAL_CHANCE))
-
-        final_chance = base_chance
-        if get_original_owner(self.target_card.get('unique_id')) == self.thief.id:
-            final_chance += STOLEN_BONUS_CHANCE
-        final_chance = min(final_chance, ABSOLUTE_MAX_STEAL_CHANCE)
-        
+        await interaction.followup.send(embed=embed)
+
+    # Runs under the thief's and victim's transaction locks; it awaits only the cluster coordinator, never Discord
+    async def resolve(self) -> discord.Embed:
+        if not any(card['name'].lower() == self.leveraged_card['name'].lower() for card in await get_user_inventory(self.thief.id)):
+            return discord.Embed(title="Steal Cancelled", color=discord.Color.yellow(), description=f"You no longer have **{self.leveraged_card['name']}** to leverage.")
+        odds, _ = steal_odds(self.thief.id, self.target_card, await get_original_owner(self.target_card.get('unique_id')), [self.leveraged_card['name']])
+        final_chance = odds[self.leveraged_card['name']]
         roll = random.uniform(0, 100)
 
         if roll <= final_chance:
-            if removed_card := remove_card_from_inventory(self.victim.id, self.target_card['name']):
-                add_card_to_inventory(self.thief, removed_card['card_name'], is_stolen=True, unique_id=removed_card['unique_id'])
-                embed = discord.Embed(title="Steal Successful!", color=discord.Color.green(), description=f"({roll:.1f} rolled, ≤ {final_chance:.1f} needed)\n{self.thief.mention} stole **{self.target_card['name']}** from {self.victim.mention}!")
-            else:
-                 embed = discord.Embed(title="Steal Error!", color=discord.Color.yellow(), description="The card vanished from the victim's inventory.")
-        else:
-            remove_card_from_inventory(self.thief.id, self.leveraged_card['name'])
-            embed = discord.Embed(title="Steal Failed!", color=discord.Color.red(), description=f"({roll:.1f} rolled, ≤ {final_chance:.1f} needed)\n{self.thief.mention} failed and lost their **{self.leveraged_card['name']}**!")
-        
-        await interaction.followup.send(embed=embed)
+            if removed_card := await remove_card_from_inventory(self.victim.id, self.target_card['name']):
+                await add_card_to_inventory(self.thief, removed_card['card_name'], is_stolen=True, unique_id=removed_card['unique_id'])
+                return discord.Embed(title="Steal Successful!", color=discord.Color.green(), description=f"({roll:.1f} rolled, ≤ {final_chance:.1f} needed)\n{self.thief.mention} stole **{self.target_card['name']}** from {self.victim.mention}!")
+            return discord.Embed(title="Steal Error!", color=discord.Color.yellow(), description="The card vanished from the victim's inventory.")
+        await remove_card_from_inventory(self.thief.id, self.leveraged_card['name'])
+        return discord.Embed(title="Steal Failed!", color=discord.Color.red(), description=f"({roll:.1f} rolled, ≤ {final_chance:.1f} needed)\n{self.thief.mention} failed and lost their **{self.leveraged_card['name']}**!")
+
     @ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         if interaction.user.id != self.thief.id:
             await interaction.response.send_message("This is not your decision.", ephemeral=True); return
+        if self.resolved:
+            await interaction.response.send_message("This steal attempt has already been resolved.", ephemeral=True); return
+        self.resolved = True
         for item in self.children: item.disabled = True
         await interaction.response.edit_message(content="Steal attempt cancelled.", view=self)
 
 class LeverageSelect(ui.Select):
-    def __init__(self, thief_inv: list, victim: discord.Member, target_card: dict):
+    def __init__(self, thief_id: int, thief_inv: list, victim: discord.Member, target_card: dict, original_owner_id: int):
         self.thief_inv, self.victim, self.target_card = thief_inv, victim, target_card
         
-        unique_names = sorted({card['name'] for card in thief_inv})
-        options = [discord.SelectOption(label=name) for name in unique_names]
+        unique_names = sorted({card['name'] for card in thief_inv})[:25]
+        self.odds, self.owner_bonus = steal_odds(thief_id, target_card, original_owner_id, unique_names)
+        options = [discord.SelectOption(label=name, description=f"~{self.odds[name]:.1f}% success chance") for name in unique_names]
         
-        super().__init__(placeholder="Choose an eligible card to risk...", options=options[:25])
+        super().__init__(placeholder="Choose an eligible card to risk...", options=options)
 
     async def callback(self, interaction: discord.Interaction):
         leveraged_card = next(c for c in self.thief_inv if c['name'] == self.values[0])
-        
-        leverage_prefix = CARD_RARITY_MAP.get(leveraged_card['name'])
-        target_prefix = CARD_RARITY_MAP.get(self.target_card['name'])
-        target_value = RARITY_VALUES.get(target_prefix, 0)
-        
-        base_chance = 0.0
-
-        if leverage_prefix == "R" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 5.0
-        elif leverage_prefix == "UR" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 15.0
-        elif leverage_prefix == "SR" and target_value >= RARITY_VALUES["L"]:
-            base_chance = 20.0
-        else:
-            leverage_value = RARITY_VALUES.get(leverage_prefix, 0)
-            diff = leverage_value - target_value
-            
-            calculated_chance = BASE_STEAL_CHANCE
-            if diff > 0:
-                advantage_range = MAX_NORMAL_STEAL_CHANCE - BASE_STEAL_CHANCE
-                calculated_chance += (diff / MAX_RARITY_VALUE_DIFFERENCE) * advantage_range
-            elif diff < 0:
-                disadvantage_range = BASE_STEAL_CHANCE - MIN_STEAL_CHANCE
-                calculated_chance -= (abs(diff) / MAX_RARITY_VALUE_DIFFERENCE) * disadvantage_range
-            base_chance = max(MIN_STEAL_CHANCE, min(calculated_chance, MAX_NORMAL_STEAL_CHANCE))
-
-        final_chance = base_chance
-        bonus_text = ""
-        if get_original_owner(self.target_card.get('unique_id')) == interaction.user.id:
-            final_chance += STOLEN_BONUS_CHANCE
-            bonus_text = f" (+{STOLEN_BONUS_CHANCE}% Owner Bonus)"
-        
-        final_chance = min(final_chance, ABSOLUTE_MAX_STEAL_CHANCE)
+        final_chance = self.odds[leveraged_card['name']]
+        bonus_text = f" (+{STOLEN_BONUS_CHANCE}% Owner Bonus)" if self.owner_bonus else ""
         
         embed = discord.Embed(title="Confirm Steal Attempt", color=discord.Color.orange())
         embed.add_field(name="Target", value=f"Stealing **{self.target_card['name']}** from {self.victim.mention}", inline=False)
@@ -436,30 +1783,243 @@ class LeverageSelect(ui.Select):
         view = StealConfirmView(interaction.user, self.victim, self.target_card, leveraged_card, interaction)
         await interaction.response.edit_message(content=None, embed=embed, view=view)
 
-class LeverageSelectView(ui.View):
-    def __init__(self, thief_inv: list, victim: discord.Member, target_card: dict):
+INVENTORY_PAGE_SIZE = 20 # Card lines per /inventory page
+INVENTORY_SORTS = {"name": "Sort: Name", "rarity": "Sort: Rarity", "count": "Sort: Most Copies"}
+
+# Rows are rebuilt only when the sort, the filter or the user's inventory changes
+class InventoryView(TimedView):
+    def __init__(self, viewer_id: int, target_user: discord.abc.User, counts: dict):
         super().__init__(timeout=180.0)
-        self.add_item(LeverageSelect(thief_inv, victim, target_card))
+        self.viewer_id, self.target_user = viewer_id, target_user
+        self.sort, self.rarity, self.page = "name", None, 0
+        self.rows, self.rows_key, self.interaction = [], None, None
+        owned = {CARD_RARITY_MAP.get(name) for name in counts}
+        rarities = [prefix for prefix in sorted(RARITY_VALUES, key=RARITY_VALUES.get, reverse=True) if prefix in owned]
+        self.sort_select.options = [discord.SelectOption(label=label, value=key, default=key == self.sort) for key, label in INVENTORY_SORTS.items()]
+        self.rarity_select.options = [discord.SelectOption(label="All rarities", value="all", default=True)] + [discord.SelectOption(label=f"Rarity: {prefix}", value=prefix) for prefix in rarities[:24]]
+
+    async def _rows(self) -> list:
+        key = (self.sort, self.rarity, await get_user_inventory_version(self.target_user.id))
+        if key != self.rows_key:
+            counts = await get_user_card_counts(self.target_user.id)
+            names = (await get_user_card_names(self.target_user.id)).names # already sorted by name
+            if self.rarity: names = [name for name in names if CARD_RARITY_MAP.get(name) == self.rarity]
+            if self.sort == "rarity": names = sorted(names, key=lambda name: -RARITY_VALUES.get(CARD_RARITY_MAP.get(name), 0))
+            elif self.sort == "count": names = sorted(names, key=lambda name: -sum(counts[name]))
+            self.rows = [(name, *counts[name]) for name in names]
+            self.rows_key = key
+        return self.rows
+
+    async def build_embed(self) -> discord.Embed:
+        rows = await self._rows()
+        pages = max(1, -(-len(rows) // INVENTORY_PAGE_SIZE))
+        self.page = min(self.page, pages - 1)
+        page_rows = rows[self.page * INVENTORY_PAGE_SIZE:(self.page + 1) * INVENTORY_PAGE_SIZE]
+        card_list = "".join(f"**{name}**" + (f" `x{clean}`" if clean > 0 else "") + (f" 훔 `x{stolen}`" if stolen > 0 else "") + "\n" for name, clean, stolen in page_rows)
+        embed = discord.Embed(title=f"{self.target_user.display_name}'s Inventory", color=discord.Color.blurple())
+        embed.description = f"Total cards to collect: {len(CARD_ANSWERS)}\n\n**Unique Cards: {len(await get_user_card_counts(self.target_user.id))}**\n\n{card_list or 'No cards match this filter.'}"
+        embed.set_thumbnail(url=self.target_user.display_avatar.url)
+        embed.set_footer(text=f"Page {self.page + 1}/{pages}")
+        self.previous_page.disabled, self.next_page.disabled = self.page == 0, self.page >= pages - 1
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.viewer_id: return True
+        await interaction.response.send_message("Run /inventory yourself to browse.", ephemeral=True); return False
+
+    async def on_timeout(self):
+        for item in self.children: item.disabled = True
+        if self.interaction:
+            try: await self.interaction.edit_original_response(view=self)
+            except discord.HTTPException: pass
+
+    @ui.button(label="◀", style=discord.ButtonStyle.secondary, row=0)
+    async def previous_page(self, interaction: discord.Interaction, button: ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+    @ui.button(label="▶", style=discord.ButtonStyle.secondary, row=0)
+    async def next_page(self, interaction: discord.Interaction, button: ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+    @ui.select(row=1)
+    async def sort_select(self, interaction: discord.Interaction, select: ui.Select):
+        self.sort, self.page = select.values[0], 0
+        for option in select.options: option.default = option.value == self.sort
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+    @ui.select(row=2)
+    async def rarity_select(self, interaction: discord.Interaction, select: ui.Select):
+        self.rarity, self.page = (None if select.values[0] == "all" else select.values[0]), 0
+        for option in select.options: option.default = option.value == select.values[0]
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+class LeverageSelectView(TimedView):
+    def __init__(self, thief_id: int, thief_inv: list, victim: discord.Member, target_card: dict, original_owner_id: int):
+        super().__init__(timeout=180.0)
+        self.add_item(LeverageSelect(thief_id, thief_inv, victim, target_card, original_owner_id))
+
+TRADE_TIMEOUT_SECONDS = 180
+
+class TradeView(TimedView):
+    def __init__(self, proposer: discord.Member, partner: discord.Member, offer: Counter, request: Counter, interaction: discord.Interaction):
+        super().__init__(timeout=TRADE_TIMEOUT_SECONDS)
+        self.proposer, self.partner, self.offer, self.request = proposer, partner, offer, request
+        self.original_interaction, self.accepted, self.resolved = interaction, set(), False
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(title="Trade Offer", description=f"{self.proposer.mention} ⇄ {self.partner.mention}", color=discord.Color.blurple())
+        for trader, cards in ((self.proposer, self.offer), (self.partner, self.request)):
+            embed.add_field(name=f"{trader.display_name} gives" + (" ✅" if trader.id in self.accepted else ""), value=format_card_list(cards) or "Nothing", inline=False)
+        embed.set_footer(text="The trade happens once both traders press Accept.")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id in (self.proposer.id, self.partner.id): return True
+        await interaction.response.send_message("This is not your trade.", ephemeral=True)
+        return False
+
+    async def on_timeout(self):
+        if self.resolved: return
+        self.resolved = True
+        for item in self.children: item.disabled = True
+        try: await self.original_interaction.edit_original_response(content="Trade offer expired.", view=self)
+        except discord.NotFound: pass
+
+    @ui.button(label="Accept", style=discord.ButtonStyle.success)
+    async def accept(self, interaction: discord.Interaction, button: ui.Button):
+        async with TRANSACTIONS.hold(users=(self.proposer.id, self.partner.id)):
+            if not (already_resolved := self.resolved):
+                self.accepted.add(interaction.user.id)
+                if both := len(self.accepted) == 2:
+                    self.resolved = True
+                    moved = await transfer_cards(card_moves(self.offer, self.proposer.id, self.partner) + card_moves(self.request, self.partner.id, self.proposer))
+        if already_resolved:
+            await interaction.response.send_message("This trade has already been resolved.", ephemeral=True); return
+        if not both:
+            await interaction.response.edit_message(embed=self.embed(), view=self); return
+        self.stop()
+        for item in self.children: item.disabled = True
+        if moved is None: content = "Trade failed: a card in it is no longer in its owner's inventory. Nothing was exchanged."
+        else:
+            content = "Trade complete!"
+            if cleansed := sum(m['was_stolen'] and not m['is_stolen'] for m in moved):
+                content += f" {cleansed} card(s) went back to their original owner and had their stolen status cleansed."
+        await interaction.response.edit_message(content=content, embed=self.embed(), view=self)
+
+    @ui.button(label="Decline", style=discord.ButtonStyle.secondary)
+    async def decline(self, interaction: discord.Interaction, button: ui.Button):
+        if self.resolved:
+            await interaction.response.send_message("This trade has already been resolved.", ephemeral=True); return
+        self.resolved = True; self.stop()
+        for item in self.children: item.disabled = True
+        await interaction.response.edit_message(content=f"Trade declined by {interaction.user.mention}.", view=self)
 
 # --- 5. SPAWN LOGIC ---
+class DailySpawnCounts:
+    def __init__(self):
+        self.day, self.by_guild = None, defaultdict(lambda: defaultdict(int))
+
+    def _roll_over(self, day):
+        if day != self.day: self.day = day; self.by_guild.clear()
+
+    def load(self, backend: StorageBackend):
+        today = datetime.now(timezone.utc).date()
+        self.day = today; self.by_guild.clear() # rebuilt rather than added to: on_ready runs again on every reconnect
+        for guild_id, card_name in backend.spawns_on(today): self.by_guild[guild_id][card_name] += 1
+        print(f"Rebuilt today's spawn counts for {len(self.by_guild)} server(s).")
+
+    def record(self, guild_id: int, card_name: str, when: datetime):
+        self._roll_over(when.date())
+        self.by_guild[guild_id][card_name] += 1
+
+    def get(self, guild_id: int) -> defaultdict:
+        self._roll_over(datetime.now(timezone.utc).date())
+        return defaultdict(int, self.by_guild.get(guild_id, {}))
+
+    def count(self, guild_id: int, card_name: str) -> int:
+        counts = self.by_guild.get(guild_id)
+        return counts.get(card_name, 0) if counts else 0
+
+DAILY_SPAWN_COUNTS = DailySpawnCounts()
+
 def get_daily_spawn_counts(guild_id: int) -> defaultdict:
     """Counts how many times each card has spawned today in a specific guild."""
-    counts = defaultdict(int)
-    today = datetime.now(timezone.utc).date()
-    try:
-        with open(SPAWN_HISTORY_CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('guild_id') == str(guild_id):
-                    try:
-                        spawn_time = datetime.fromisoformat(row['timestamp'])
-                        if spawn_time.date() == today:
-                            counts[row['card_name']] += 1
-                    except (ValueError, TypeError):
-                        continue
-    except FileNotFoundError:
-        pass
-    return counts
+    return DAILY_SPAWN_COUNTS.get(guild_id)
+
+class FenwickTree:
+    __slots__ = ("tree", "total")
+    def __init__(self, weights: list):
+        self.tree, self.total = [0] + list(weights), sum(weights)
+        for i in range(1, len(self.tree)):
+            if (parent := i + (i & -i)) < len(self.tree): self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, delta: int):
+        self.total += delta; index += 1
+        while index < len(self.tree): self.tree[index] += delta; index += index & -index
+
+    def find(self, target: int) -> int:
+        position, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if (nxt := position + step) < len(self.tree) and self.tree[nxt] <= target:
+                position, target = nxt, target - self.tree[nxt]
+            step >>= 1
+        return position
+
+class GuildSpawnMask:
+    __slots__ = ("version", "day", "eligible", "tree")
+
+# Each guild's Fenwick tree holds only the cards it may spawn now, patched as spawns land
+class SpawnSampler:
+    def __init__(self):
+        self.version, self.cards, self.cumulative, self.indices_by_name, self.guilds = None, (), (), {}, {}
+
+    def _sync_catalog(self):
+        if self.version == CARD_CATALOG_VERSION: return
+        self.version, self.guilds = CARD_CATALOG_VERSION, {}
+        self.cards, self.cumulative, self.indices_by_name = CATALOG.cards, CATALOG.cumulative, CATALOG.indices_by_name
+
+    def _is_eligible(self, guild_id: int, card_name: str) -> bool:
+        return card_name not in RECENTLY_SPAWNED[guild_id] and DAILY_SPAWN_COUNTS.count(guild_id, card_name) < DAILY_SPAWN_LIMIT
+
+    def _mask(self, guild_id: int) -> GuildSpawnMask:
+        self._sync_catalog()
+        today = datetime.now(timezone.utc).date()
+        mask = self.guilds.get(guild_id)
+        if mask is None or mask.day != today:
+            DAILY_SPAWN_COUNTS.get(guild_id) # Rolls the counters over first if the day has changed.
+            mask = self.guilds[guild_id] = GuildSpawnMask()
+            mask.version, mask.day = self.version, today
+            mask.eligible = [self._is_eligible(guild_id, card.main_name) for card in self.cards]
+            mask.tree = FenwickTree([card.weight if ok else 0 for card, ok in zip(self.cards, mask.eligible)])
+        return mask
+
+    def _refresh(self, guild_id: int, mask: GuildSpawnMask, card_name: str):
+        eligible = self._is_eligible(guild_id, card_name)
+        for index in self.indices_by_name.get(card_name, ()):
+            if mask.eligible[index] != eligible:
+                mask.eligible[index] = eligible
+                mask.tree.add(index, self.cards[index].weight if eligible else -self.cards[index].weight)
+
+    def record_spawn(self, guild_id: int, card_name: str, evicted_name: str = None):
+        if (mask := self.guilds.get(guild_id)) is None or mask.version != self.version: return
+        self._refresh(guild_id, mask, card_name)
+        if evicted_name is not None: self._refresh(guild_id, mask, evicted_name)
+
+    def choose(self, guild_id: int) -> CardRecord:
+        mask = self._mask(guild_id)
+        if mask.tree.total > 0:
+            return self.cards[mask.tree.find(random.randrange(mask.tree.total))]
+        print(f"Warning: All cards for guild {guild_id} have hit their daily spawn limit. Spawning from recently-spawned filtered pool only.")
+        history, total = RECENTLY_SPAWNED[guild_id], self.cumulative[-1]
+        recent_weight = sum(self.cards[i].weight for name in set(history) for i in self.indices_by_name.get(name, ()))
+        while recent_weight < total:
+            card = self.cards[bisect.bisect_right(self.cumulative, random.randrange(total))]
+            if card.main_name not in history: return card
+        return self.cards[bisect.bisect_right(self.cumulative, random.randrange(total))]
+
+SPAWN_SAMPLER = SpawnSampler()
 
 async def do_spawn(source, guild_id: int, specific_card_name: str = None):
     if not ALL_CARDS:
@@ -468,64 +2028,116 @@ async def do_spawn(source, guild_id: int, specific_card_name: str = None):
         
     chosen_card = None
     if specific_card_name:
-        chosen_card = next((card for card in ALL_CARDS if card['main_name'].lower() == specific_card_name.lower()), None)
+        chosen_card = CATALOG.by_lower_name.get(specific_card_name.lower())
     else:
-        history = RECENTLY_SPAWNED[guild_id]
-        daily_counts = get_daily_spawn_counts(guild_id)
-
-        eligible_cards = [
-            card for card in ALL_CARDS 
-            if card['main_name'] not in history 
-            and daily_counts[card['main_name']] < DAILY_SPAWN_LIMIT
-        ]
-
-        if not eligible_cards:
-            print(f"Warning: All cards for guild {guild_id} have hit their daily spawn limit. Spawning from recently-spawned filtered pool only.")
-            eligible_cards = [card for card in ALL_CARDS if card['main_name'] not in history]
-
-        if not eligible_cards:
-            eligible_cards = ALL_CARDS
-
-        eligible_weights = [card['weight'] for card in eligible_cards]
-        chosen_card = random.choices(eligible_cards, weights=eligible_weights, k=1)[0]
+        chosen_card = SPAWN_SAMPLER.choose(guild_id)
             
     if not chosen_card:
         if isinstance(source, discord.Interaction): await source.followup.send(f"Could not find a card to spawn.", ephemeral=True)
         return
         
-    RECENTLY_SPAWNED[guild_id].append(chosen_card['main_name'])
-    log_spawn(guild_id, chosen_card['main_name'])
+    history = RECENTLY_SPAWNED[guild_id]
+    evicted_name = history[0] if len(history) == history.maxlen else None
+    history.append(chosen_card.main_name)
+    log_spawn(guild_id, chosen_card.main_name)
+    SPAWN_SAMPLER.record_spawn(guild_id, chosen_card.main_name, evicted_name)
     embed = discord.Embed(title="A Wild Card Has Appeared!", description="Click the button and guess its name!", color=discord.Color.blue())
-    view = SpawnView(main_display_name=chosen_card['main_name'], correct_answers_list=chosen_card['all_answers'], full_card_path=chosen_card['full_path'])
+    view = SpawnView(main_display_name=chosen_card.main_name, correct_answers_list=chosen_card.all_answers, full_card_path=chosen_card.full_path)
     try:
-        with open(chosen_card['thumb_path'], 'rb') as f:
-            picture = discord.File(f)
-            message = None
-            if isinstance(source, discord.Interaction):
-                message = await source.followup.send(embed=embed, file=picture, view=view, wait=True)
-            else:
-                message = await source.send(embed=embed, file=picture, view=view)
-            view.message = message
+        if isinstance(source, discord.Interaction):
+            message = await send_card_art(source.followup.send, embed, chosen_card.thumb_path, view=view, wait=True)
+        else:
+            message = await send_card_art(source.send, embed, chosen_card.thumb_path, view=view)
+        view.message = message
     except Exception as e:
         print(f"An error occurred during do_spawn message sending: {e}")
 
-@tasks.loop(seconds=30)
-async def timed_spawn_checker():
-    now = datetime.now(timezone.utc)
-    for guild_id_str, config in list(SERVER_CONFIGS.items()):
-        if not config.get('is_approved', False): continue
+# SERVER_CONFIGS' next_spawn_time stays the source of truth; superseded heap entries are skipped when popped
+class SpawnScheduler:
+    def __init__(self):
+        self.heap, self.deadlines, self.in_flight, self.tasks = [], {}, set(), set()
+        self.wakeup, self.semaphore, self.runner = None, None, None
+
+    def start(self):
+        if self.runner and not self.runner.done(): return
+        self.wakeup, self.semaphore = asyncio.Event(), asyncio.Semaphore(SPAWN_DISPATCH_CONCURRENCY)
+        for guild_id_str in list(SERVER_CONFIGS): self.schedule(guild_id_str)
+        self.runner = asyncio.create_task(self.run())
+
+    def schedule(self, guild_id_str: str, deadline: float = None):
+        if not owns_guild(guild_id_str): return
+        if deadline is None:
+            config = SERVER_CONFIGS.get(guild_id_str, {})
+            self.deadlines.pop(guild_id_str, None)
+            if not (config.get('is_approved', False) and config.get("spawn_channel_id") and config.get("next_spawn_time")): return
+            try: deadline = datetime.fromisoformat(config["next_spawn_time"]).timestamp()
+            except (ValueError, TypeError):
+                print(f"Invalid next_spawn_time for server {guild_id_str}: {config['next_spawn_time']!r}"); return
+        self.deadlines[guild_id_str] = deadline
+        heapq.heappush(self.heap, (deadline, guild_id_str))
+        if self.wakeup and self.heap[0] == (deadline, guild_id_str): self.wakeup.set()
+
+    async def run(self):
+        await bot.wait_until_ready() # Channels aren't cached before the first READY
+        while True:
+            self.wakeup.clear()
+            delay = self.heap[0][0] - time.time() if self.heap else None
+            if delay is None or delay > 0:
+                try: await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError: pass
+                continue
+            deadline, guild_id_str = heapq.heappop(self.heap)
+            if self.deadlines.get(guild_id_str) != deadline or guild_id_str in self.in_flight: continue
+            del self.deadlines[guild_id_str]
+            self.in_flight.add(guild_id_str)
+            task = asyncio.create_task(self.dispatch(guild_id_str, deadline))
+            self.tasks.add(task); task.add_done_callback(self.tasks.discard)
+
+    async def dispatch(self, guild_id_str: str, deadline: float):
+        retry = True
         try:
-            channel_id, next_spawn_time_str = config.get("spawn_channel_id"), config.get("next_spawn_time")
-            if not (channel_id and next_spawn_time_str): continue
-            if now >= datetime.fromisoformat(next_spawn_time_str):
-                channel, guild_id = bot.get_channel(channel_id), int(guild_id_str)
+            async with self.semaphore:
+                METRICS.observe("spawn_dispatch_delay_seconds", max(0.0, time.time() - deadline))
+                config = SERVER_CONFIGS.get(guild_id_str, {})
+                if not (config.get('is_approved', False) and config.get("spawn_channel_id")):
+                    retry = False; return
+                channel, guild_id = bot.get_channel(config["spawn_channel_id"]), int(guild_id_str)
                 if channel:
                     await do_spawn(channel, guild_id)
                     next_interval = random.randint(MIN_SPAWN_INTERVAL, MAX_SPAWN_INTERVAL)
-                    SERVER_CONFIGS[guild_id_str]["next_spawn_time"] = (datetime.now(timezone.utc) + timedelta(minutes=next_interval)).isoformat()
+                    config["next_spawn_time"] = (datetime.now(timezone.utc) + timedelta(minutes=next_interval)).isoformat()
+                    mark_config_dirty(guild_id_str)
+                    retry = False
         except Exception:
             print(f"--- UNHANDLED EXCEPTION FOR SERVER {guild_id_str} ---"); traceback.print_exc()
-    save_configs()
+        finally:
+            self.in_flight.discard(guild_id_str)
+            if guild_id_str not in self.deadlines:
+                if retry: self.schedule(guild_id_str, time.time() + SPAWN_RETRY_SECONDS)
+                else: self.schedule(guild_id_str)
+
+SPAWN_SCHEDULER = SpawnScheduler()
+
+@tasks.loop(seconds=INVENTORY_FLUSH_SECONDS)
+async def inventory_flusher():
+    try: await INVENTORY_STORE.flush_async()
+    except Exception:
+        print("--- FAILED TO FLUSH INVENTORY (will retry) ---"); traceback.print_exc()
+
+@tasks.loop(seconds=LOG_ARCHIVE_INTERVAL_SECONDS)
+async def log_archiver():
+    try:
+        if archived := await STORAGE_IO.run(STORAGE.archive_logs): print(f"Archived {archived} log segment(s).")
+    except Exception:
+        print("--- FAILED TO ARCHIVE LOGS (will retry) ---"); traceback.print_exc()
+
+@tasks.loop(seconds=RATE_LIMIT_SNAPSHOT_SECONDS)
+async def rate_limit_snapshotter():
+    for limiter in RATE_LIMITS.values(): limiter.prune()
+    try:
+        if (snapshot := save_rate_limits()) is not None: await STORAGE_IO.run(safe_atomic_write_json, RATE_LIMITS_FILE, snapshot)
+    except Exception:
+        print("--- FAILED TO SAVE RATE LIMITS ---"); traceback.print_exc()
 
 # --- 6. COMMANDS & CHECKS ---
 async def is_server_approved(interaction: discord.Interaction) -> bool:
@@ -578,11 +2190,66 @@ async def request_approval(interaction: discord.Interaction):
 async def ping(interaction: discord.Interaction):
     await interaction.response.send_message(f"Pong! `({round(bot.latency * 1000)}ms)`")
 
+def format_latency_series(name: str, label_fmt, limit: int = 8) -> str:
+    rows = sorted(METRICS.series(name), key=lambda row: row[1].quantile(0.95), reverse=True)[:limit]
+    lines = [f"{label_fmt(labels):<24} n={h.count:<6} avg {h.total / h.count * 1000:7.1f}ms  p95 {h.quantile(0.95) * 1000:7.1f}ms" for labels, h in rows if h.count]
+    return "```" + "\n".join(lines) + "```" if lines else "No data yet."
+
+stats_group = app_commands.Group(name="stats", description="Bot and card statistics.")
+@stats_group.command(name="bot", description="[Owner] Show runtime latency and cache statistics.")
+async def stats_bot(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True); return
+    embed = discord.Embed(title="BlitzDex Runtime Stats", color=discord.Color.dark_teal(), timestamp=datetime.now(timezone.utc))
+    embed.add_field(name="Slowest commands (by p95)", value=format_latency_series("command_seconds", lambda l: f"/{l['command']}" + (" (err)" if l['status'] == 'error' else "")), inline=False)
+    embed.add_field(name="Slowest view callbacks", value=format_latency_series("view_callback_seconds", lambda l: f"{l['view']}.{l['item']}", 5), inline=False)
+    embed.add_field(name="Storage", value=format_latency_series("storage_seconds", lambda l: l['op'], 6), inline=False)
+    embed.add_field(name="Spawn dispatch delay", value=format_latency_series("spawn_dispatch_delay_seconds", lambda l: "timed spawns", 1), inline=False)
+    embed.add_field(name="Event loop lag", value=format_latency_series("event_loop_lag_seconds", lambda l: "loop", 1), inline=False)
+    reads, sends = ASSET_CACHE.hits + ASSET_CACHE.misses, ATTACHMENT_URLS.hits + ATTACHMENT_URLS.misses
+    caches = f"Card art: {ASSET_CACHE.size / 1024 / 1024:.1f} MB in memory" + (f", {ASSET_CACHE.hits / reads:.0%} of reads from memory" if reads else "")
+    caches += f"\nAttachment URLs: {len(ATTACHMENT_URLS.entries)} cached" + (f", {ATTACHMENT_URLS.hits / sends:.0%} of images sent without uploading" if sends else "")
+    embed.add_field(name="Caches", value=caches, inline=False)
+    embed.set_footer(text=f"Gateway latency {bot.latency * 1000:.0f}ms" + (f" · metrics on :{METRICS_PORT}/metrics" if METRICS_PORT else ""))
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@stats_group.command(name="card", description="Show how many copies of a card exist and how often it's been claimed.")
+@app_commands.describe(card_name="The card to look up.")
+async def stats_card(interaction: discord.Interaction, card_name: str):
+    if not await is_server_approved(interaction): return
+    card = CATALOG.by_lower_name.get(card_name.lower())
+    if not card:
+        await interaction.response.send_message("There's no card with that name.", ephemeral=True); return
+    stats = await query_card_stats(card.main_name, interaction.guild_id)
+    embed = discord.Embed(title=card.main_name, description=f"Rarity: **{card.prefix}**", color=discord.Color.dark_gold())
+    embed.add_field(name="Copies", value=f"{stats['copies']:,}" + (f" ({stats['stolen']:,} stolen)" if stats['stolen'] else ""))
+    embed.add_field(name="Owners", value=f"{stats['owners']:,}")
+    embed.add_field(name="Claims", value=f"{stats['server_claims']:,} here · {stats['claims']:,} everywhere")
+    await send_card_art(interaction.response.send_message, embed, card.thumb_path)
+@stats_card.autocomplete('card_name')
+async def stats_card_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    return catalog_name_index().choices(current)
+bot.tree.add_command(stats_group)
+
+@bot.tree.command(name="leaderboard", description="Show the top collectors in this server or across every server.")
+@app_commands.describe(board="What to rank collectors by.", scope="This server only, or every server.")
+@app_commands.choices(board=[app_commands.Choice(name=title, value=board) for board, title in LEADERBOARD_BOARDS.items()],
+                      scope=[app_commands.Choice(name="This server", value="server"), app_commands.Choice(name="Global", value="global")])
+async def leaderboard(interaction: discord.Interaction, board: str = "unique", scope: str = "server"):
+    if not await is_server_approved(interaction): return
+    entries = await query_leaderboard(board, interaction.guild_id if scope == "server" else None)
+    where = interaction.guild.name if scope == "server" else "All Servers"
+    embed = discord.Embed(title=f"{LEADERBOARD_BOARDS[board]} — {where}", color=discord.Color.gold())
+    embed.description = "\n".join(f"**{rank}.** <@{user_id}> — {score:,}" for rank, (user_id, score) in enumerate(entries, 1)) or "Nobody is on this board yet."
+    await interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
 @bot.tree.command(name="spawn", description="Manually spawns a random card.")
 async def manual_spawn(interaction: discord.Interaction):
     if not await is_server_approved(interaction): return
     if not has_spawn_permission(interaction):
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True); return
+    if wait := RATE_LIMITS["spawn"].hit(interaction.guild.id):
+        await interaction.response.send_message(f"This server is spawning cards too fast. Try again {retry_time(wait)}.", ephemeral=True); return
     await interaction.response.defer()
     await do_spawn(interaction, interaction.guild.id)
 
@@ -592,65 +2259,113 @@ async def specific_spawn(interaction: discord.Interaction, card_name: str):
     if not await is_server_approved(interaction): return
     if not has_spawn_permission(interaction):
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True); return
+    if wait := RATE_LIMITS["spawn"].hit(interaction.guild.id):
+        await interaction.response.send_message(f"This server is spawning cards too fast. Try again {retry_time(wait)}.", ephemeral=True); return
     await interaction.response.defer()
     await do_spawn(interaction, interaction.guild.id, specific_card_name=card_name)
 @specific_spawn.autocomplete('card_name')
 async def specific_spawn_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    all_card_names = [card['main_name'] for card in ALL_CARDS]
-    return [app_commands.Choice(name=name, value=name) for name in all_card_names if current.lower() in name.lower()][:25]
+    return catalog_name_index().choices(current)
+
+@bot.tree.command(name="reload_cards", description="[Owner] Reload the card catalog from disk.")
+async def reload_cards(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True)
+    catalog = await reload_catalog(force=True)
+    if catalog: await interaction.followup.send(f"Card catalog v{catalog.version} is live with {len(catalog.cards)} cards.", ephemeral=True)
+    else: await interaction.followup.send("The catalog could not be rebuilt; the current one is still in use. Check the logs.", ephemeral=True)
 
 @bot.tree.command(name="inventory", description="Check your or another user's card inventory.")
 @app_commands.describe(user="The user whose inventory you want to see.")
 async def inventory(interaction: discord.Interaction, user: discord.Member = None):
     if not await is_server_approved(interaction): return
-    target_user, inv = user or interaction.user, get_user_inventory((user or interaction.user).id)
-    embed = discord.Embed(title=f"{target_user.display_name}'s Inventory", color=discord.Color.blurple())
-    desc = f"Total cards to collect: {len(CARD_ANSWERS)}\n\n"
-    if not inv: desc += "This inventory is empty."
-    else:
-        counts = defaultdict(lambda: {'clean': 0, 'stolen': 0})
-        for card in inv: counts[card['name']]['stolen' if card['is_stolen'] else 'clean'] += 1
-        card_list = "".join(f"**{name}**" + (f" `x{data['clean']}`" if data['clean'] > 0 else "") + (f" 훔 `x{data['stolen']}`" if data['stolen'] > 0 else "") + "\n" for name, data in sorted(counts.items()))
-        desc += f"**Unique Cards: {len(counts)}**\n\n{card_list}"
-    embed.description = desc
-    embed.set_thumbnail(url=target_user.display_avatar.url)
-    await interaction.response.send_message(embed=embed)
-
-@bot.tree.command(name="give", description="Give one of your cards to another user.")
-@app_commands.describe(user="The user you want to give a card to.", card_name="The name of the card you are giving.")
-async def give(interaction: discord.Interaction, user: discord.Member, card_name: str):
+    target_user = user or interaction.user
+    if not (counts := await get_user_card_counts(target_user.id)):
+        embed = discord.Embed(title=f"{target_user.display_name}'s Inventory", color=discord.Color.blurple(), description=f"Total cards to collect: {len(CARD_ANSWERS)}\n\nThis inventory is empty.")
+        embed.set_thumbnail(url=target_user.display_avatar.url)
+        await interaction.response.send_message(embed=embed); return
+    view = InventoryView(interaction.user.id, target_user, counts)
+    await interaction.response.send_message(embed=await view.build_embed(), view=view)
+    view.interaction = interaction
+
+# --- Card Lists ---
+CARD_LIST_MAX = 25 # Cards one /give or one side of a /trade can move
+
+# 'Foo, Bar x3' -> Counter({'Foo': 1, 'Bar': 3})
+def parse_card_list(text: str) -> Counter:
+    cards = Counter()
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        name, _, copies = part.rpartition(' x')
+        if name.strip() and copies.isdigit(): cards[name.strip()] += int(copies)
+        else: cards[part] += 1
+    return cards
+
+# (card name -> copies, None), or (None, why not)
+async def resolve_card_list(user_id: int, text: str, whose: str) -> tuple:
+    wanted, counts = parse_card_list(text), await get_user_card_counts(user_id)
+    if sum(wanted.values()) > CARD_LIST_MAX: return None, f"You can move at most {CARD_LIST_MAX} cards at once."
+    owned, cards = {name.lower(): name for name in counts}, Counter()
+    for name, copies in wanted.items():
+        if (match := owned.get(name.lower())) is None: return None, f"**{name}** isn't in {whose} inventory."
+        cards[match] += copies
+    for name, copies in cards.items():
+        if (have := sum(counts[name])) < copies: return None, f"There's only {have} **{name}** in {whose} inventory, not {copies}."
+    return cards, None
+
+def format_card_list(cards: Counter) -> str:
+    return ", ".join(f"**{name}**" + (f" ×{copies}" if copies > 1 else "") for name, copies in cards.items())
+
+def card_moves(cards: Counter, from_user_id: int, to_user: discord.User) -> list:
+    return [(from_user_id, name, to_user.id, to_user.name) for name, copies in cards.items() for _ in range(copies)]
+
+def card_list_choices(names: NameIndex, current: str) -> list:
+    typed, _, last = current.rpartition(',')
+    values = ((f"{typed}, " if typed else "") + name for name in names.search(last.strip()))
+    return [app_commands.Choice(name=value, value=value) for value in values if len(value) <= 100]
+
+@bot.tree.command(name="give", description="Give one or more of your cards to another user.")
+@app_commands.describe(user="The user you want to give cards to.", cards="The cards you are giving, separated by commas (e.g. `Foo, Bar x3`).")
+async def give(interaction: discord.Interaction, user: discord.Member, cards: str):
     if not await is_server_approved(interaction): return
     if user.bot or user == interaction.user:
         await interaction.response.send_message("You can't give cards to yourself or a bot.", ephemeral=True); return
 
-    removed_card = remove_card_from_inventory(interaction.user.id, card_name)
-
-    if removed_card:
-        card_unique_id = removed_card.get('unique_id')
-        original_owner_id = get_original_owner(card_unique_id)
-        
-        was_stolen = str(removed_card.get('is_stolen')).lower() == 'true'
-
-        is_now_stolen = False
-        if was_stolen:
-            if original_owner_id is not None and original_owner_id == user.id:
-                is_now_stolen = False
-            else:
-                is_now_stolen = True
-        
-        add_card_to_inventory(user, card_name, is_stolen=is_now_stolen, unique_id=card_unique_id)
+    async with TRANSACTIONS.hold(users=(interaction.user.id, user.id)):
+        given, problem = await resolve_card_list(interaction.user.id, cards, "your")
+        moved = await transfer_cards(card_moves(given, interaction.user.id, user)) if given else None
 
-        msg = f"You have given **{card_name}** to {user.mention}."
-        if was_stolen and not is_now_stolen:
-            msg += " As they are the original owner, its stolen status has been cleansed."
-        
+    if moved:
+        msg = f"You have given {format_card_list(given)} to {user.mention}."
+        if cleansed := sum(m['was_stolen'] and not m['is_stolen'] for m in moved):
+            msg += " As they are the original owner, its stolen status has been cleansed." if len(moved) == 1 else f" As they are the original owner, {cleansed} of them had their stolen status cleansed."
         await interaction.response.send_message(msg)
-    else: 
-        await interaction.response.send_message(f"You don't have **{card_name}** to give.", ephemeral=True)
-@give.autocomplete('card_name')
+    else:
+        await interaction.response.send_message(problem or ("You no longer have those cards to give." if given else "List at least one card to give."), ephemeral=True)
+@give.autocomplete('cards')
 async def give_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    unique_names = sorted({card['name'] for card in get_user_inventory(interaction.user.id)})
-    return [app_commands.Choice(name=name, value=name) for name in unique_names if current.lower() in name.lower()][:25]
+    return card_list_choices(await get_user_card_names(interaction.user.id), current)
+
+@bot.tree.command(name="trade", description="Offer another user a swap of cards; it happens once you both accept.")
+@app_commands.describe(user="The user you want to trade with.", offer="Your cards, separated by commas (e.g. `Foo, Bar x3`).",
+                       request="Their cards you want in return, separated by commas.")
+async def trade(interaction: discord.Interaction, user: discord.Member, offer: str = "", request: str = ""):
+    if not await is_server_approved(interaction): return
+    if user.bot or user == interaction.user:
+        await interaction.response.send_message("You can't trade with yourself or a bot.", ephemeral=True); return
+    offered, problem = await resolve_card_list(interaction.user.id, offer, "your")
+    if offered is not None: requested, problem = await resolve_card_list(user.id, request, f"{user.display_name}'s")
+    if problem or not (offered or requested):
+        await interaction.response.send_message(problem or "List at least one card to offer or request.", ephemeral=True); return
+    view = TradeView(interaction.user, user, offered, requested, interaction)
+    await interaction.response.send_message(f"{user.mention}, {interaction.user.mention} wants to trade with you.", embed=view.embed(), view=view)
+@trade.autocomplete('offer')
+async def trade_offer_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    return card_list_choices(await get_user_card_names(interaction.user.id), current)
+@trade.autocomplete('request')
+async def trade_request_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    if not (partner := getattr(interaction.namespace, 'user', None)): return []
+    return card_list_choices(await get_user_card_names(partner.id), current)
 
 @bot.tree.command(name="steal", description="Attempt to steal a card from another user.")
 @app_commands.describe(victim="The user you want to steal from.", card_name="The name of the card you want to steal.")
@@ -663,15 +2378,10 @@ async def steal(interaction: discord.Interaction, victim: discord.Member, card_n
     if victim.id in immune_ids or any(role.id in immune_ids for role in victim.roles):
         await interaction.response.send_message(f"{victim.display_name} is immune to stealing.", ephemeral=True); return
     if not (thief.id in immune_ids or any(role.id in immune_ids for role in thief.roles)):
-        now = datetime.now(timezone.utc); one_hour_ago = now - timedelta(hours=STEAL_COOLDOWN_HOURS)
-        recent_timestamps = [t for t in config.get('steal_timestamps', []) if datetime.fromisoformat(t) > one_hour_ago]
-        if len(recent_timestamps) >= 2:
-            SERVER_CONFIGS.setdefault(guild_id, {})['steal_timestamps'] = recent_timestamps; save_configs()
-            await interaction.response.send_message(f"The server-wide steal command is on cooldown (Max 2 uses per hour).", ephemeral=True); return
-        recent_timestamps.append(now.isoformat())
-        SERVER_CONFIGS.setdefault(guild_id, {})['steal_timestamps'] = recent_timestamps; save_configs()
+        if wait := RATE_LIMITS["steal"].hit(interaction.guild.id):
+            await interaction.response.send_message(f"The server-wide steal command is on cooldown (Max {STEAL_LIMIT} uses per hour). Try again {retry_time(wait)}.", ephemeral=True); return
     
-    victim_inv = get_user_inventory(victim.id)
+    victim_inv = await get_user_inventory(victim.id)
     target_card = next((card for card in victim_inv if card['name'].lower() == card_name.lower()), None)
     if not target_card:
         await interaction.response.send_message(f"{victim.display_name} does not have that card.", ephemeral=True); return
@@ -679,37 +2389,33 @@ async def steal(interaction: discord.Interaction, victim: discord.Member, card_n
     if CARD_RARITY_MAP.get(target_card['name']) not in STEALABLE_RARITIES:
         await interaction.response.send_message("This card's rarity is too low to be stolen (must be R or above).", ephemeral=True); return
     
-    thief_inv = get_user_inventory(thief.id)
+    thief_inv = await get_user_inventory(thief.id)
     eligible_leverage_cards = [card for card in thief_inv if CARD_RARITY_MAP.get(card['name']) in STEALABLE_RARITIES]
     if not eligible_leverage_cards:
         await interaction.response.send_message("You have no cards of high enough rarity (R or above) to leverage for a steal.", ephemeral=True); return
     
-    view = LeverageSelectView(eligible_leverage_cards, victim, target_card)
+    view = LeverageSelectView(thief.id, eligible_leverage_cards, victim, target_card, await get_original_owner(target_card['unique_id']))
     await interaction.response.send_message("Choose an eligible card from your inventory to risk for this steal attempt.", view=view, ephemeral=True)
 @steal.autocomplete('card_name')
 async def steal_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
     if not (victim_user := getattr(interaction.namespace, 'victim', None)): return []
-    victim_inv = get_user_inventory(victim_user.id)
-    unique_stealable_names = sorted({c['name'] for c in victim_inv if CARD_RARITY_MAP.get(c['name']) in STEALABLE_RARITIES})
-    return [app_commands.Choice(name=name, value=name) for name in unique_stealable_names if current.lower() in name.lower()][:25]
+    return (await get_user_card_names(victim_user.id, stealable_only=True)).choices(current)
 
 card_group = app_commands.Group(name="card", description="Commands related to viewing your cards.")
 @card_group.command(name="view", description="View a specific card you own.")
 @app_commands.describe(card_name="The name of the card you want to see.")
 async def card_view(interaction: discord.Interaction, card_name: str):
     if not await is_server_approved(interaction): return
-    if card_name not in [c['name'] for c in get_user_inventory(interaction.user.id)]:
+    if card_name not in await get_user_card_names(interaction.user.id):
         await interaction.response.send_message("You do not own that card.", ephemeral=True); return
-    card_to_show = next((card for card in ALL_CARDS if card['main_name'] == card_name), None)
+    card_to_show = CATALOG.by_lower_name.get(card_name.lower())
     if not card_to_show:
         await interaction.response.send_message("Error finding that card's image.", ephemeral=True); return
     embed = discord.Embed(title=f"{interaction.user.display_name} is viewing:", description=f"**{card_name}**", color=discord.Color.dark_gold())
-    with open(card_to_show['full_path'], 'rb') as f:
-        await interaction.response.send_message(embed=embed, file=discord.File(f))
+    await send_card_art(interaction.response.send_message, embed, card_to_show.full_path)
 @card_view.autocomplete('card_name')
 async def card_view_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    unique_names = sorted({card['name'] for card in get_user_inventory(interaction.user.id)})
-    return [app_commands.Choice(name=name, value=name) for name in unique_names if current.lower() in name.lower()][:25]
+    return (await get_user_card_names(interaction.user.id)).choices(current)
 bot.tree.add_command(card_group)
 
 config_group = app_commands.Group(name="config", description="Admin commands for this server.", default_permissions=discord.Permissions(manage_guild=True))
@@ -726,7 +2432,7 @@ async def set_spawn_channel(interaction: discord.Interaction, channel: discord.T
         await interaction.response.send_message(f"✅ Spawn channel set. First card in ~{first_interval} minutes.", ephemeral=True)
     else:
         await interaction.response.send_message(f"✅ Spawn channel updated to {channel.mention}.", ephemeral=True)
-    save_configs()
+    mark_config_dirty(guild_id); SPAWN_SCHEDULER.schedule(guild_id)
 
 @config_group.command(name="allow_spawn", description="Allow a user or role to use the /spawn command.")
 @app_commands.describe(target="The user or role to grant permission to.")
@@ -737,7 +2443,7 @@ async def allow_spawn(interaction: discord.Interaction, target: Union[discord.Me
     allowed_list = SERVER_CONFIGS.setdefault(guild_id, {}).setdefault("spawn_allowed_ids", [])
     if target.id not in allowed_list:
         allowed_list.append(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} can now use `/spawn`.", ephemeral=True)
     else: await interaction.response.send_message(f"⚠️ {target.mention} already has permission.", ephemeral=True)
 
@@ -749,7 +2455,7 @@ async def deny_spawn(interaction: discord.Interaction, target: Union[discord.Mem
     guild_id = str(interaction.guild.id)
     if target.id in SERVER_CONFIGS.get(guild_id, {}).get("spawn_allowed_ids", []):
         SERVER_CONFIGS[guild_id]["spawn_allowed_ids"].remove(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} can no longer use `/spawn`.", ephemeral=True)
     else: await interaction.response.send_message(f"⚠️ {target.mention} did not have custom permission.", ephemeral=True)
 
@@ -772,7 +2478,7 @@ async def allow_steal_immunity(interaction: discord.Interaction, target: Union[d
     immune_list = SERVER_CONFIGS.setdefault(guild_id, {}).setdefault("steal_immune_ids", [])
     if target.id not in immune_list:
         immune_list.append(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} is now immune to `/steal`.", ephemeral=True)
     else: await interaction.response.send_message(f"⚠️ {target.mention} is already immune.", ephemeral=True)
 
@@ -784,7 +2490,7 @@ async def deny_steal_immunity(interaction: discord.Interaction, target: Union[di
     guild_id = str(interaction.guild.id)
     if target.id in SERVER_CONFIGS.get(guild_id, {}).get("steal_immune_ids", []):
         SERVER_CONFIGS[guild_id]["steal_immune_ids"].remove(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} is no longer immune to `/steal`.", ephemeral=True)
     else: await interaction.response.send_message(f"⚠️ {target.mention} was not immune.", ephemeral=True)
 
@@ -815,7 +2521,7 @@ async def ban_admin(interaction: discord.Interaction, target: discord.Member):
         await interaction.response.send_message(f"⚠️ {target.mention} is already banned from using bot commands.", ephemeral=True)
     else:
         banned_list.append(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} has been **banned** from using bot admin commands.", ephemeral=True)
 
 @config_group.command(name="unban_admin", description="Unban an admin, allowing them to use bot commands again.")
@@ -829,7 +2535,7 @@ async def unban_admin(interaction: discord.Interaction, target: discord.Member):
         await interaction.response.send_message(f"⚠️ {target.mention} is not currently banned.", ephemeral=True)
     else:
         banned_list.remove(target.id)
-        save_configs()
+        mark_config_dirty(guild_id)
         await interaction.response.send_message(f"✅ {target.mention} has been **unbanned** and can now use bot admin commands.", ephemeral=True)
 
 @config_group.command(name="view_banned_admins", description="View the list of admins banned from using bot commands.")
@@ -853,11 +2559,12 @@ async def on_guild_join(guild: discord.Guild):
     guild_id_str = str(guild.id)
     print(f"Joined new guild: {guild.name} ({guild_id_str})")
     SERVER_CONFIGS[guild_id_str] = { "is_approved": False }
-    save_configs()
+    await save_configs_async([guild_id_str]); SPAWN_SCHEDULER.schedule(guild_id_str)
     await send_approval_dm(guild)
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    record_command_latency(interaction, "error")
     if isinstance(error, app_commands.TransformerError):
         await interaction.response.send_message(
             f"❌ I couldn't understand the value you provided for one of the options. Please make sure you select an item from the list (e.g., a user, channel, or role mention).",
@@ -871,17 +2578,479 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
         else:
             await interaction.followup.send("An unexpected error occurred. I've notified my developer.", ephemeral=True)
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command_latency(interaction, "ok")
+
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user} (ID: {bot.user.id})'); print('------')
-    ensure_data_files_exist()
-    load_configs(); load_prefix_weights(); load_card_names(); load_cards(); load_spawn_history()
-    bot.add_view(ApprovalView())
+
+@contextlib.contextmanager
+def startup_stage(name: str):
+    start = time.perf_counter()
+    yield
+    print(f"  [STARTUP] {name}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+def command_tree_hash() -> str:
+    commands_payload = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()), key=lambda c: (c.get('type', 1), c['name']))
+    return hashlib.sha256(json.dumps([bot.application_id, commands_payload], sort_keys=True).encode()).hexdigest()
+
+# FORCE_COMMAND_SYNC=1 syncs even an unchanged tree
+async def sync_command_tree():
+    digest = command_tree_hash()
+    try:
+        with open(COMMAND_TREE_HASH_FILE, 'r') as f: synced_digest = f.read().strip()
+    except FileNotFoundError: synced_digest = None
+    if digest == synced_digest and os.environ.get('FORCE_COMMAND_SYNC') != '1':
+        print("Command tree unchanged since the last sync; skipping."); return
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} command(s)")
+        safe_atomic_write_text(COMMAND_TREE_HASH_FILE, digest)
     except Exception as e: print(e)
-    timed_spawn_checker.start()
+
+# Needs no Discord connection, so benchmark.py uses it too
+def load_data():
+    with startup_stage("data files"): ensure_data_files_exist()
+    with startup_stage("server configs"): load_configs(); load_rate_limits()
+    with startup_stage("card catalog"): install_catalog(compile_card_catalog(CARD_CATALOG_VERSION + 1))
+    with startup_stage("spawn history"): load_spawn_history(); DAILY_SPAWN_COUNTS.load(STORAGE)
+    if CLUSTER_CLIENT is None: # held by the coordinator in cluster mode
+        with startup_stage("inventories"): INVENTORY_STORE.load()
+        with startup_stage("original owners"): load_original_owners()
+
+def register_metric_gauges():
+    METRICS.gauge("guilds", "Guilds the bot is in.", lambda: len(bot.guilds))
+    if CLUSTER_CLIENT is None:
+        METRICS.gauge("inventory_cards", "Cards held across all inventories.", lambda: len(INVENTORY_STORE.by_unique_id))
+        METRICS.gauge("inventory_pending_ops", "Inventory changes not yet written to storage.", lambda: len(INVENTORY_STORE.pending_ops))
+    METRICS.gauge("storage_pending_records", "Log records queued for the storage thread.", lambda: sum(map(len, STORAGE_IO.pending.values())))
+    METRICS.gauge("asset_cache_bytes", "Bytes of card art held in memory.", lambda: ASSET_CACHE.size)
+    METRICS.gauge("asset_cache_hits_total", "Card art reads served from memory.", lambda: ASSET_CACHE.hits, "counter")
+    METRICS.gauge("asset_cache_misses_total", "Card art reads that went to disk.", lambda: ASSET_CACHE.misses, "counter")
+    METRICS.gauge("attachment_url_hits_total", "Card images sent by reusing an uploaded URL.", lambda: ATTACHMENT_URLS.hits, "counter")
+    METRICS.gauge("attachment_url_misses_total", "Card images that had to be uploaded.", lambda: ATTACHMENT_URLS.misses, "counter")
+    METRICS.gauge("gateway_latency_seconds", "Discord gateway heartbeat latency.", lambda: bot.latency)
+    METRICS.gauge("catalog_version", "Installed card catalog version.", lambda: CARD_CATALOG_VERSION)
+
+STARTUP_TASKS = set()
+async def initialize_bot():
+    print("Initializing BlitzDex...")
+    start = time.perf_counter()
+    if CLUSTER_CLIENT: await CLUSTER_CLIENT.connect() # subscribed before the configs are fetched, so no change slips between
+    load_data()
+    bot.add_view(ApprovalView())
+    if CLUSTER_WORKER_INDEX in (None, 0) and not CLUSTER_FAKE_GATEWAY: # one sync per cluster is enough
+        with startup_stage("command sync"): await sync_command_tree()
+    SPAWN_SCHEDULER.start(); catalog_watcher.start(); loop_lag_sampler.start(); rate_limit_snapshotter.start()
+    if CLUSTER_CLIENT is None:
+        inventory_flusher.start(); log_archiver.start()
+        task = asyncio.create_task(load_claim_stats())
+        STARTUP_TASKS.add(task); task.add_done_callback(STARTUP_TASKS.discard)
+    register_metric_gauges(); await start_metrics_server()
+    task = asyncio.create_task(preload_card_art()) # Warms the art cache in the background; no need to hold up login
+    STARTUP_TASKS.add(task); task.add_done_callback(STARTUP_TASKS.discard)
+    print(f"Initialization finished in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+def migrate_to_sqlite():
+    source, target = CsvStorage(INVENTORY_PERSISTENCE), SqliteStorage(SQLITE_DB_FILE)
+    source.setup(); target.setup()
+    try: target.import_from(source)
+    finally: source.close(); target.close()
+    print("Set STORAGE_BACKEND=sqlite to run the bot against the new database.")
+
+# --- Cluster Mode ---
+# `python bot.py cluster --workers N` runs a coordinator and N worker processes on one machine. The coordinator owns the
+# inventories, logs and configs and serves them over a Unix socket; each worker connects to Discord with its share of
+# the shards and only schedules spawns for guilds on them. `--fake-gateway` runs the workers without Discord at all.
+CLUSTER_CONNECT_TIMEOUT_SECONDS = 30
+CLUSTER_CALL_TIMEOUT_SECONDS = 5 # Calls made on the event loop; a stalled coordinator must not freeze a worker for long
+CLUSTER_STORAGE_TIMEOUT_SECONDS = 60 # Calls from the storage thread, which wait on the coordinator's disk
+CLUSTER_MESSAGE_LIMIT = 16 * 1024 * 1024 # Longest line the coordinator accepts (a full config save can be large)
+FAKE_GATEWAY_USERS = 50 # Fake members who claim spawns with --fake-gateway
+
+def guild_shard(guild_id) -> int:
+    return (int(guild_id) >> 22) % CLUSTER_SHARD_COUNT # Discord's own guild -> shard mapping
+
+def owns_guild(guild_id_str: str) -> bool:
+    return CLUSTER_SHARD_IDS is None or guild_shard(guild_id_str) in CLUSTER_SHARD_IDS
+
+def encode_message(message) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode() + b"\n"
+
+def cluster_reply(op: str, reply: dict):
+    if "error" in reply: raise RuntimeError(f"Coordinator failed '{op}': {reply['error']}")
+    return reply["ok"]
+
+# For the storage thread and startup, which can afford to wait; the event loop talks through ClusterClient
+class BlockingClusterClient:
+    def __init__(self, path: str = None, timeout: float = CLUSTER_STORAGE_TIMEOUT_SECONDS):
+        self.path, self.timeout, self.lock, self.request_ids = path or CLUSTER_SOCKET_FILE, timeout, threading.Lock(), itertools.count()
+        self._connect()
+
+    def _connect(self):
+        deadline = time.time() + CLUSTER_CONNECT_TIMEOUT_SECONDS
+        while True: # the coordinator may still be starting
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try: self.sock.connect(self.path); break
+            except (FileNotFoundError, ConnectionRefusedError):
+                self.sock.close()
+                if time.time() > deadline: raise
+                time.sleep(0.2)
+        self.sock.settimeout(self.timeout)
+        self.stream = self.sock.makefile('rwb')
+
+    def call(self, op: str, *args):
+        with self.lock, METRICS.timer("cluster_call_seconds", op=op):
+            try:
+                self.stream.write(encode_message([next(self.request_ids), op, args])); self.stream.flush()
+                line = self.stream.readline()
+            except TimeoutError:
+                # A timed-out read leaves the stream's buffer in an unknown state, so start over on a fresh connection
+                self.close(); self._connect()
+                raise TimeoutError(f"The cluster coordinator didn't answer '{op}' within {self.timeout:g}s.") from None
+        if not line: raise ConnectionError("Lost the connection to the cluster coordinator.")
+        return cluster_reply(op, json.loads(line))
+
+    def close(self):
+        self.stream.close(); self.sock.close()
+
+# Calls carry an id, so any number can be in flight without blocking the loop; the same stream brings the coordinator's
+# pushes (other workers' config saves, changed inventories)
+class ClusterClient:
+    def __init__(self, path: str = None, timeout: float = CLUSTER_CALL_TIMEOUT_SECONDS):
+        self.path, self.timeout, self.lock = path or CLUSTER_SOCKET_FILE, timeout, asyncio.Lock()
+        self.writer, self.listener, self.store = None, None, None # store: the RemoteInventoryStore whose cache pushes invalidate
+        self.pending, self.request_ids = {}, itertools.count() # request id -> future for its reply
+
+    async def connect(self):
+        async with self.lock:
+            if self.writer is not None: return
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=CLUSTER_MESSAGE_LIMIT)
+            writer.write(encode_message([None, "subscribe", [CLUSTER_WORKER_INDEX]]))
+            self.writer, self.listener = writer, asyncio.create_task(self.listen(reader))
+
+    async def call(self, op: str, *args):
+        with METRICS.timer("cluster_call_seconds", op=op):
+            if self.writer is None: await self.connect()
+            request_id = next(self.request_ids)
+            future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+            try:
+                self.writer.write(encode_message([request_id, op, args]))
+                reply = await asyncio.wait_for(future, self.timeout)
+            except TimeoutError: # a late reply finds no future and is dropped
+                raise TimeoutError(f"The cluster coordinator didn't answer '{op}' within {self.timeout:g}s.") from None
+            finally: self.pending.pop(request_id, None)
+        return cluster_reply(op, reply)
+
+    async def listen(self, reader: asyncio.StreamReader):
+        with contextlib.suppress(ConnectionError):
+            while line := await reader.readline():
+                message = json.loads(line)
+                if "id" in message:
+                    if (future := self.pending.get(message["id"])) is not None and not future.done(): future.set_result(message)
+                elif "configs" in message:
+                    apply_config_changes(message["configs"])
+                    for guild_id_str in message["configs"]: SPAWN_SCHEDULER.schedule(guild_id_str)
+                elif self.store is not None: self.store.invalidate(message["inventories"])
+        # Pushes sent while disconnected are lost, so nothing cached can be trusted; the next call reconnects
+        self.writer.close(); self.writer = None
+        for future in self.pending.values():
+            if not future.done(): future.set_exception(ConnectionError("Lost the connection to the cluster coordinator."))
+        if self.store is not None: self.store.invalidate()
+        print("--- LOST THE CONNECTION TO THE CLUSTER COORDINATOR ---")
+
+    async def close(self):
+        if self.listener is not None: self.listener.cancel()
+        if self.writer is not None: self.writer.close(); self.writer = None
+
+class RemoteStorage(StorageBackend):
+    def __init__(self, path: str = None): self.client = BlockingClusterClient(path)
+    def load_configs(self) -> dict: return self.client.call("configs")
+    def load_inventory(self) -> list: return []
+    def write_inventory(self, ops: list, snapshot: list = None): raise RuntimeError("Inventories are written by the cluster coordinator")
+    def log_claims(self, rows: list): self.client.call("log", "log_claims", rows)
+    def log_spawns(self, rows: list): self.client.call("log", "log_spawns", rows)
+    def log_original_owners(self, rows: list): self.client.call("log", "log_original_owners", rows)
+    def iter_original_owners(self): return iter(())
+    def iter_claims(self): return iter(())
+    def spawns_on(self, day) -> list: return [tuple(row) for row in self.client.call("spawns_on", day.isoformat())]
+    def recent_spawns(self, per_guild: int) -> list: return [tuple(row) for row in self.client.call("recent_spawns", per_guild)]
+    def save_configs(self, changes: dict): self.client.call("save_configs", CLUSTER_WORKER_INDEX, changes)
+    def close(self): self.client.close()
+
+# Async, unlike InventoryStore: every method may wait on the coordinator. A user's card counts, and the version and
+# name indexes that go with them, are cached until the coordinator pushes a change to that inventory.
+class RemoteInventoryStore:
+    pending_ops = ()
+    def __init__(self, client: ClusterClient):
+        self.client, client.store = client, self
+        self.summaries = {} # user_id -> [version, card counts, {stealable_only: NameIndex}]
+        self.changes = defaultdict(int) # user_id (None for everyone) -> invalidations, so a reply that raced one isn't cached
+
+    def load(self): pass
+
+    def invalidate(self, user_ids: list = None):
+        if user_ids is None: self.summaries.clear(); self.changes[None] += 1; return
+        for user_id in user_ids: self.summaries.pop(user_id, None); self.changes[user_id] += 1
+
+    async def _summary(self, user_id: int) -> list:
+        if (summary := self.summaries.get(user_id)) is not None: return summary
+        stamp = (self.changes[None], self.changes.get(user_id, 0))
+        summary = [*await self.client.call("card_counts", user_id), {}]
+        if stamp == (self.changes[None], self.changes.get(user_id, 0)): self.summaries[user_id] = summary
+        return summary
+
+    async def get(self, user_id: int) -> list: return await self.client.call("inventory", user_id)
+
+    async def add(self, user_id: int, username: str, card_name: str, is_stolen: bool, unique_id: str):
+        try: await self.client.call("add", user_id, username, card_name, is_stolen, unique_id)
+        finally: self.invalidate([user_id])
+
+    async def remove(self, user_id: int, card_name: str) -> dict:
+        try: return await self.client.call("remove", user_id, card_name)
+        finally: self.invalidate([user_id])
+
+    async def transfer(self, moves: list) -> Union[list, None]:
+        try: return await self.client.call("transfer", moves)
+        finally: self.invalidate([move[0] for move in moves] + [move[2] for move in moves])
+
+    async def card_counts(self, user_id: int) -> dict: return (await self._summary(user_id))[1]
+    async def version(self, user_id: int) -> int: return (await self._summary(user_id))[0]
+
+    async def names(self, user_id: int, stealable_only: bool = False) -> NameIndex:
+        _, counts, indexes = await self._summary(user_id)
+        if (index := indexes.get(stealable_only)) is None:
+            names = [name for name in counts if CARD_RARITY_MAP.get(name) in STEALABLE_RARITIES] if stealable_only else counts
+            index = indexes[stealable_only] = NameIndex(names)
+        return index
+
+    def rarities_changed(self):
+        for _, _, indexes in self.summaries.values(): indexes.pop(True, None)
+
+    async def flush_async(self): pass
+    def close(self): pass
+
+class RemoteOriginalOwners:
+    def __init__(self, client: ClusterClient): self.client = client
+    async def get(self, unique_id: str) -> int: return await self.client.call("original_owner", unique_id)
+    def setdefault(self, unique_id: str, owner_id: int): pass
+
+# Runs before anything is loaded
+def configure_cluster_worker(index: int, shard_ids: list, shard_count: int):
+    global CLUSTER_CLIENT, CLUSTER_WORKER_INDEX, CLUSTER_SHARD_IDS, CLUSTER_SHARD_COUNT, STORAGE, STORAGE_IO, INVENTORY_STORE, ORIGINAL_OWNERS, METRICS_PORT, RATE_LIMITS_FILE
+    CLUSTER_WORKER_INDEX, CLUSTER_SHARD_IDS, CLUSTER_SHARD_COUNT = index, frozenset(shard_ids), shard_count
+    RATE_LIMITS_FILE = os.path.join(DATA_DIR, f"rate_limits.worker{index}.json") # limits are per process; a worker keeps its own servers' windows
+    CLUSTER_CLIENT = ClusterClient() # connected by initialize_bot, on the event loop
+    STORAGE = RemoteStorage(); STORAGE_IO = StorageIO(STORAGE)
+    INVENTORY_STORE, ORIGINAL_OWNERS = RemoteInventoryStore(CLUSTER_CLIENT), RemoteOriginalOwners(CLUSTER_CLIENT)
+    bot.shard_ids, bot.shard_count = list(shard_ids), shard_count
+    if METRICS_PORT: METRICS_PORT += index # one /metrics endpoint per worker
+    print(f"Cluster worker {index}: shards {sorted(shard_ids)} of {shard_count}.")
+
+# --- Coordinator ---
+CLUSTER_SUBSCRIBERS = {} # worker index -> StreamWriter that receives other workers' config changes and changed inventories
+
+async def coordinator_log(method: str, rows: list):
+    if method not in ("log_claims", "log_spawns", "log_original_owners"): raise ValueError(f"Unknown log '{method}'")
+    if method == "log_original_owners":
+        for unique_id, owner_id in rows: ORIGINAL_OWNERS.setdefault(unique_id, owner_id)
+    elif method == "log_claims":
+        for _, user_id, _, card_name, guild_id in rows: LEADERBOARDS.record_claim(guild_id, user_id, card_name)
+    await asyncio.gather(*(STORAGE_IO.submit(method, tuple(row), wait=True) for row in rows))
+
+async def coordinator_save_configs(worker_index: int, changes: dict):
+    apply_config_changes(changes)
+    await save_configs_async(list(changes))
+    message = encode_message({"configs": changes})
+    for index, writer in list(CLUSTER_SUBSCRIBERS.items()):
+        if index != worker_index: writer.write(message)
+
+# Tells every worker to drop its cached summaries of these inventories; written before the reply, on the same stream
+def coordinator_changed(user_ids: list, result=None):
+    message = encode_message({"inventories": sorted(set(user_ids))})
+    for writer in list(CLUSTER_SUBSCRIBERS.values()): writer.write(message)
+    return result
+
+CLUSTER_OPS = {
+    "configs": lambda: SERVER_CONFIGS,
+    "inventory": lambda user_id: INVENTORY_STORE.get(user_id),
+    "add": lambda user_id, *card: coordinator_changed([user_id], INVENTORY_STORE.add(user_id, *card)),
+    "remove": lambda user_id, card_name: coordinator_changed([user_id], INVENTORY_STORE.remove(user_id, card_name)),
+    "transfer": lambda moves: coordinator_changed([move[0] for move in moves] + [move[2] for move in moves], INVENTORY_STORE.transfer(moves)),
+    "card_counts": lambda user_id: [INVENTORY_STORE.version(user_id), INVENTORY_STORE.card_counts(user_id)],
+    "original_owner": lambda unique_id: ORIGINAL_OWNERS.get(unique_id),
+    "spawns_on": lambda day: STORAGE_IO.run(STORAGE.spawns_on, datetime.fromisoformat(day).date()),
+    "recent_spawns": lambda per_guild: STORAGE_IO.run(STORAGE.recent_spawns, per_guild),
+    "leaderboard": lambda board, guild_id: LEADERBOARDS.top(board, guild_id),
+    "card_stats": lambda card_name, guild_id: LEADERBOARDS.card_stats(card_name, guild_id),
+    "log": coordinator_log,
+    "save_configs": coordinator_save_configs,
+}
+
+def cluster_error_reply(request_id, op: str, error: Exception) -> dict:
+    print(f"--- CLUSTER CALL '{op}' FAILED ---"); traceback.print_exc()
+    return {"id": request_id, "error": f"{type(error).__name__}: {error}"}
+
+async def finish_cluster_call(writer: asyncio.StreamWriter, request_id, op: str, pending):
+    try: reply = {"id": request_id, "ok": await pending}
+    except Exception as e: reply = cluster_error_reply(request_id, op, e)
+    writer.write(encode_message(reply))
+
+# Ops that don't await run without yielding, which makes each inventory change atomic across the cluster. Ops that do
+# (logs, config saves) answer from a task, so the calls queued behind them on the same connection aren't held up.
+async def serve_cluster_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    subscriber, waiting = None, set()
+    try:
+        while line := await reader.readline():
+            request_id, op, args = json.loads(line)
+            if op == "subscribe":
+                subscriber = args[0]; CLUSTER_SUBSCRIBERS[subscriber] = writer; continue
+            try:
+                result = CLUSTER_OPS[op](*args)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.create_task(finish_cluster_call(writer, request_id, op, result))
+                    waiting.add(task); task.add_done_callback(waiting.discard); continue
+                reply = {"id": request_id, "ok": result}
+            except Exception as e: reply = cluster_error_reply(request_id, op, e)
+            writer.write(encode_message(reply)); await writer.drain()
+    except (ConnectionError, asyncio.CancelledError): pass # a worker went away, or the coordinator is shutting down
+    finally:
+        if subscriber is not None and CLUSTER_SUBSCRIBERS.get(subscriber) is writer: del CLUSTER_SUBSCRIBERS[subscriber]
+        writer.close()
+
+async def run_coordinator():
+    print("Starting cluster coordinator...")
+    with startup_stage("data files"): ensure_data_files_exist()
+    with startup_stage("server configs"): load_configs()
+    with startup_stage("card catalog"): install_catalog(compile_card_catalog(CARD_CATALOG_VERSION + 1)) # rarity scores; read once at startup
+    with startup_stage("inventories"): INVENTORY_STORE.load()
+    with startup_stage("original owners"): load_original_owners()
+    claim_stats = asyncio.create_task(load_claim_stats()) # queued on the storage thread ahead of any worker's claims
+    inventory_flusher.start(); log_archiver.start()
+    with contextlib.suppress(FileNotFoundError): os.remove(CLUSTER_SOCKET_FILE)
+    server = await asyncio.start_unix_server(serve_cluster_connection, path=CLUSTER_SOCKET_FILE, limit=CLUSTER_MESSAGE_LIMIT)
+    os.chmod(CLUSTER_SOCKET_FILE, 0o600)
+    stop, loop = asyncio.Event(), asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT): loop.add_signal_handler(signum, stop.set)
+    print(f"Coordinator listening on {CLUSTER_SOCKET_FILE}")
+    await stop.wait()
+    server.close(); inventory_flusher.stop(); log_archiver.cancel(); claim_stats.cancel()
+    with contextlib.suppress(FileNotFoundError): os.remove(CLUSTER_SOCKET_FILE)
+
+# --- Fake Gateway ---
+FAKE_GATEWAY_TASKS = set()
+
+class FakeMessage:
+    async def edit(self, **kwargs): pass
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.guild_id = next((int(guild_id_str) for guild_id_str, config in SERVER_CONFIGS.items() if config.get('spawn_channel_id') == channel_id), None)
+    async def send(self, content: str = None, embed: discord.Embed = None, view: ui.View = None, **kwargs):
+        print(f"[FAKE GATEWAY] worker {CLUSTER_WORKER_INDEX} -> channel {self.id}: {embed.title if embed else content}")
+        if isinstance(view, SpawnView):
+            task = asyncio.create_task(fake_claim(view, self.guild_id))
+            FAKE_GATEWAY_TASKS.add(task); task.add_done_callback(FAKE_GATEWAY_TASKS.discard)
+        return FakeMessage()
+
+# GuessingModal.on_submit's correct-guess path, minus the replies
+async def fake_claim(view: SpawnView, guild_id: int):
+    user_id = random.randint(1, FAKE_GATEWAY_USERS)
+    user = SimpleNamespace(id=user_id, name=f"fake-user-{user_id}")
+    async with TRANSACTIONS.hold(users=(user.id,), spawns=(id(view),)):
+        if view.claimed: return
+        view.claimed = True; view.stop()
+        unique_id = await add_card_to_inventory(user, view.main_display_name)
+        log_card_claim(user, view.main_display_name, guild_id); log_original_owner(unique_id, user.id)
+
+async def run_fake_gateway():
+    async def ready(): pass
+    bot.get_channel, bot.wait_until_ready = FakeChannel, ready
+    await initialize_bot()
+    for guild_id_str in list(SERVER_CONFIGS): SPAWN_SCHEDULER.schedule(guild_id_str, time.time())
+    await asyncio.Event().wait()
+
+# --- Launcher ---
+def raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+# Workers stop first so their last writes still reach the coordinator
+def run_cluster(workers: int, shard_count: int, fake_gateway: bool):
+    script = [sys.executable, os.path.realpath(__file__)]
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+    with contextlib.suppress(FileNotFoundError): os.remove(CLUSTER_SOCKET_FILE)
+    # Own sessions, so a Ctrl+C in this terminal reaches the children once, through us, in the right order
+    coordinator, processes = subprocess.Popen(script + ["coordinator"], start_new_session=True), []
+    try:
+        BlockingClusterClient().close() # returns once the coordinator accepts connections
+        for index in range(workers):
+            shard_ids = ",".join(map(str, range(index, shard_count, workers)))
+            command = script + ["worker", "--index", str(index), "--shards", shard_ids, "--shard-count", str(shard_count)]
+            processes.append(subprocess.Popen(command + (["--fake-gateway"] if fake_gateway else []), start_new_session=True))
+        print(f"Cluster running: {workers} worker(s), {shard_count} shard(s).")
+        while coordinator.poll() is None and all(process.poll() is None for process in processes): time.sleep(1)
+        print("A cluster process exited; stopping the cluster.")
+    except KeyboardInterrupt: print("Stopping the cluster...")
+    finally:
+        for process in processes:
+            if process.poll() is None: process.send_signal(signal.SIGINT)
+        for process in processes: process.wait()
+        if coordinator.poll() is None: coordinator.terminate()
+        coordinator.wait()
+
+async def recommended_shard_count() -> int:
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(TOKEN)
+        shards, _, _ = await http.get_bot_gateway()
+        return shards
+    finally: await http.close()
+
+def run_cluster_command(argv: list):
+    global CLUSTER_FAKE_GATEWAY
+    parser = argparse.ArgumentParser(prog="bot.py", description="Run BlitzDex as a storage coordinator plus sharded worker processes.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    cluster = subcommands.add_parser("cluster", help="Start a coordinator and its workers")
+    cluster.add_argument("--workers", type=int, default=2)
+    cluster.add_argument("--shard-count", type=int, default=None, help="Total shards (default: Discord's recommended count, or one per worker with --fake-gateway)")
+    cluster.add_argument("--fake-gateway", action="store_true", help="Don't connect to Discord; print spawns and have fake members claim them")
+    subcommands.add_parser("coordinator", help="Serve storage to the workers (started by `cluster`)")
+    worker = subcommands.add_parser("worker", help="Run some of the shards (started by `cluster`)")
+    worker.add_argument("--index", type=int, required=True)
+    worker.add_argument("--shards", required=True, help="Comma-separated shard IDs")
+    worker.add_argument("--shard-count", type=int, required=True)
+    worker.add_argument("--fake-gateway", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "cluster":
+        shard_count = args.shard_count or (args.workers if args.fake_gateway else max(asyncio.run(recommended_shard_count()), args.workers))
+        if not 0 < args.workers <= shard_count: parser.error("need at least one worker and at least one shard per worker")
+        run_cluster(args.workers, shard_count, args.fake_gateway); return
+    if args.command == "coordinator": asyncio.run(run_coordinator())
+    else:
+        CLUSTER_FAKE_GATEWAY = args.fake_gateway
+        configure_cluster_worker(args.index, [int(shard_id) for shard_id in args.shards.split(',')], args.shard_count)
+        if not args.fake_gateway: bot.run(TOKEN)
+        else:
+            try: asyncio.run(run_fake_gateway())
+            except KeyboardInterrupt: pass
+    close_storage()
+
+# Runs after the event loop has stopped
+def close_storage():
+    STORAGE_IO.close()
+    CONFIG_FLUSHER.flush()
+    INVENTORY_STORE.close()
+    if (snapshot := save_rate_limits(force=True)) is not None: safe_atomic_write_json(RATE_LIMITS_FILE, snapshot)
 
 # --- 8. RUN THE BOT ---
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate-sqlite"]:
+        migrate_to_sqlite(); sys.exit()
+    if sys.argv[1:2] in (["cluster"], ["coordinator"], ["worker"]):
+        run_cluster_command(sys.argv[1:]); sys.exit()
+    bot.run(TOKEN)
+    close_storage()
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Offline asset pipeline for BlitzDex.
+
+Builds size-optimized card art and thumbnails from `cards/` and `thumbnails/` into `assets/`, and writes
+`assets/manifest.json`, which the bot loads at startup instead of scanning the image folders.
+
+    pip install -r requirements-build.txt
+    python build_assets.py [--format webp|png] [--quality 90] [--thumb-size 420] [--workers N] [--force]
+
+Hand-made thumbnails are kept and only recompressed; cards without one get a thumbnail generated from the full
+art. Output files are named after a hash of their content, and unchanged cards are not rebuilt on later runs.
+A card that fails to build keeps its previous outputs and manifest entry.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+CARDS_PATH = os.path.join(SCRIPT_DIR, "cards")
+THUMBNAILS_PATH = os.path.join(SCRIPT_DIR, "thumbnails")
+ASSETS_PATH = os.path.join(SCRIPT_DIR, "assets")
+MANIFEST_FILE = os.path.join(ASSETS_PATH, "manifest.json")
+MANIFEST_VERSION = 1
+THUMB_SUFFIXES = ("_thumb.png", "_thunb.png") # A few hand-made thumbnails were saved with the typo
+
+
+def sha256_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_thumbnail(stem: str):
+    for suffix in THUMB_SUFFIXES:
+        path = os.path.join(THUMBNAILS_PATH, stem + suffix)
+        if os.path.exists(path): return path
+    return None
+
+
+def encode(image: Image.Image, settings: dict, original: bytes = None) -> bytes:
+    out = io.BytesIO()
+    if settings["format"] == "webp":
+        image.save(out, format="WEBP", quality=settings["quality"], method=6)
+    else:
+        image.save(out, format="PNG", optimize=True)
+    data = out.getvalue()
+    # Re-encoding an already tight PNG can come out bigger; keep the original bytes then
+    if original is not None and settings["format"] == "png" and len(data) >= len(original): return original
+    return data
+
+
+def write_hashed(directory: str, stem: str, data: bytes, extension: str) -> str:
+    name = f"{stem}.{sha256_of(data)[:12]}.{extension}"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        temp = path + ".tmp"
+        with open(temp, 'wb') as f: f.write(data)
+        os.replace(temp, path)
+    return os.path.relpath(path, ASSETS_PATH).replace(os.sep, '/')
+
+
+def build_card(job: dict) -> dict:
+    """Builds one card's art and thumbnail. Runs in a worker process."""
+    filename, settings = job["filename"], job["settings"]
+    stem, extension = filename[:-len(".png")], settings["format"]
+    with open(os.path.join(CARDS_PATH, filename), 'rb') as f: full_source = f.read()
+    thumb_source_path = find_thumbnail(stem)
+    thumb_source = None
+    if thumb_source_path:
+        with open(thumb_source_path, 'rb') as f: thumb_source = f.read()
+
+    with Image.open(io.BytesIO(full_source)) as image:
+        image.load()
+        full = encode(image, settings, full_source)
+        if thumb_source is None:
+            size = settings["thumb_size"]
+            thumb = encode(ImageOps.contain(image, (size, size), Image.LANCZOS), settings)
+    if thumb_source is not None:
+        with Image.open(io.BytesIO(thumb_source)) as image:
+            image.load(); thumb = encode(image, settings, thumb_source)
+
+    return {
+        "filename": filename,
+        "full": write_hashed(os.path.join(ASSETS_PATH, "cards"), stem, full, extension),
+        "thumb": write_hashed(os.path.join(ASSETS_PATH, "thumbnails"), f"{stem}_thumb", thumb, extension),
+        "source_sha256": sha256_of(full_source),
+        "thumb_source_sha256": sha256_of(thumb_source) if thumb_source is not None else None,
+        "thumb_generated": thumb_source is None,
+        "full_bytes": len(full), "thumb_bytes": len(thumb),
+        "source_bytes": len(full_source) + (len(thumb_source) if thumb_source is not None else 0),
+    }
+
+
+def outputs_exist(entry: dict) -> bool:
+    return all(os.path.exists(os.path.join(ASSETS_PATH, entry[key])) for key in ("full", "thumb"))
+
+
+def is_up_to_date(entry: dict, filename: str) -> bool:
+    stem = filename[:-len(".png")]
+    if not outputs_exist(entry): return False
+    with open(os.path.join(CARDS_PATH, filename), 'rb') as f:
+        if sha256_of(f.read()) != entry["source_sha256"]: return False
+    thumb_source_path = find_thumbnail(stem)
+    if thumb_source_path is None: return entry["thumb_source_sha256"] is None
+    with open(thumb_source_path, 'rb') as f: return sha256_of(f.read()) == entry["thumb_source_sha256"]
+
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return {}
+
+
+def remove_stale_outputs(cards: dict):
+    referenced = {entry[key] for entry in cards.values() for key in ("full", "thumb")}
+    for folder in ("cards", "thumbnails"):
+        for name in os.listdir(os.path.join(ASSETS_PATH, folder)):
+            if f"{folder}/{name}" not in referenced: os.remove(os.path.join(ASSETS_PATH, folder, name))
+
+
+def run_jobs(pool, jobs):
+    """Yields each job's result in order, or the exception it raised, so one bad image doesn't stop the build."""
+    futures = [pool.submit(build_card, job) for job in jobs]
+    for future in futures:
+        try: yield future.result()
+        except Exception as e: yield e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build optimized card assets and the asset manifest.")
+    parser.add_argument("--format", choices=["webp", "png"], default="webp")
+    parser.add_argument("--quality", type=int, default=90, help="WebP quality (ignored for PNG)")
+    parser.add_argument("--thumb-size", type=int, default=420, help="Bounding box for generated thumbnails")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every card even if its sources are unchanged")
+    args = parser.parse_args()
+
+    settings = {"format": args.format, "quality": args.quality, "thumb_size": args.thumb_size}
+    for folder in ("cards", "thumbnails"): os.makedirs(os.path.join(ASSETS_PATH, folder), exist_ok=True)
+    previous = load_manifest()
+    reusable = previous.get("cards", {}) if previous.get("settings") == settings and not args.force else {}
+
+    filenames = sorted(f for f in os.listdir(CARDS_PATH) if f.endswith(".png") and '_' in f)
+    cards, jobs = {}, []
+    for filename in filenames:
+        if filename in reusable and is_up_to_date(reusable[filename], filename): cards[filename] = reusable[filename]
+        else: jobs.append({"filename": filename, "settings": settings})
+    print(f"{len(filenames)} cards: {len(cards)} up to date, {len(jobs)} to build.")
+
+    failed = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for job, result in zip(jobs, run_jobs(pool, jobs)):
+                if isinstance(result, Exception):
+                    print(f"  [FAILED] {job['filename']}: {result}"); failed += 1
+                    if (entry := previous.get("cards", {}).get(job['filename'])) and outputs_exist(entry):
+                        cards[job['filename']] = entry; print(f"  [KEPT PREVIOUS BUILD] {job['filename']}")
+                    continue
+                if result.pop("thumb_generated"): print(f"  [GENERATED THUMBNAIL] {result['filename']}")
+                cards[result.pop("filename")] = result
+
+    for filename in sorted(os.listdir(THUMBNAILS_PATH)):
+        if filename.endswith("_thunb.png"): print(f"  [MISNAMED THUMBNAIL] '{filename}' should end in _thumb.png")
+
+    remove_stale_outputs(cards)
+    manifest = {"version": MANIFEST_VERSION, "settings": settings, "cards": dict(sorted(cards.items()))}
+    temp = MANIFEST_FILE + ".tmp"
+    with open(temp, 'w', encoding='utf-8') as f: json.dump(manifest, f, indent=2)
+    os.replace(temp, MANIFEST_FILE)
+
+    source = sum(entry["source_bytes"] for entry in cards.values())
+    built = sum(entry["full_bytes"] + entry["thumb_bytes"] for entry in cards.values())
+    print(f"Wrote {MANIFEST_FILE}: {len(cards)} cards, {source / 1024 / 1024:.1f} MB -> {built / 1024 / 1024:.1f} MB.")
+    if failed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""AttachmentUrlCache against a local fake CDN: expiry from the signed `ex` param, HEAD revalidation, and the
+fallback to uploading when no reusable URL is left.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import web
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="blitzdex-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import bot  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0): self.now = now
+    def __call__(self) -> float: return self.now
+
+
+def message_with_image(url: str):
+    return SimpleNamespace(embeds=[SimpleNamespace(image=SimpleNamespace(url=url))], attachments=[])
+
+
+class AttachmentUrlCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.status, self.heads = 200, 0
+        async def head(request: web.Request) -> web.Response:
+            self.heads += 1
+            return web.Response(status=self.status)
+        app = web.Application()
+        app.router.add_route("HEAD", "/attachments/{name}", head)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/attachments"
+        self.clock = FakeClock()
+        self.cache = bot.AttachmentUrlCache(clock=self.clock)
+
+    async def asyncTearDown(self):
+        await self.cache.close()
+        await self.runner.cleanup()
+
+    def url(self, name: str = "C_card.png", expires_in: float = None) -> str:
+        url = f"{self.base}/{name}"
+        return url if expires_in is None else f"{url}?ex={int(self.clock.now + expires_in):x}&is=0&hm=0"
+
+    async def test_signed_expiry_stops_reuse_ahead_of_the_deadline(self):
+        url = self.url(expires_in=2 * 3600)
+        self.cache.record("C_card.png", message_with_image(url))
+        self.clock.now += 2 * 3600 - bot.ATTACHMENT_URL_EXPIRY_MARGIN_SECONDS + 1
+        self.assertIsNone(await self.cache.get("C_card.png")) # past ex minus the margin
+        self.assertEqual(self.heads, 0)
+        self.assertNotIn("C_card.png", self.cache.entries)
+
+    async def test_recently_validated_url_is_reused_without_a_request(self):
+        url = self.url(expires_in=24 * 3600)
+        self.cache.record("C_card.png", message_with_image(url))
+        self.clock.now += bot.ATTACHMENT_URL_REVALIDATE_SECONDS - 1
+        self.assertEqual(await self.cache.get("C_card.png"), url)
+        self.assertEqual((self.heads, self.cache.hits), (0, 1))
+
+    async def test_revalidation_success_keeps_the_url(self):
+        url = self.url()
+        self.cache.record("C_card.png", message_with_image(url))
+        self.clock.now += bot.ATTACHMENT_URL_REVALIDATE_SECONDS + 1
+        self.assertEqual(await self.cache.get("C_card.png"), url)
+        self.assertEqual(await self.cache.get("C_card.png"), url) # validated just now, so no second HEAD
+        self.assertEqual(self.heads, 1)
+
+    async def test_revalidation_failure_drops_the_url(self):
+        self.cache.record("C_card.png", message_with_image(self.url()))
+        self.status = 404
+        self.clock.now += bot.ATTACHMENT_URL_REVALIDATE_SECONDS + 1
+        self.assertIsNone(await self.cache.get("C_card.png"))
+        self.assertEqual((self.heads, self.cache.misses), (1, 1))
+        self.assertNotIn("C_card.png", self.cache.entries)
+
+    async def test_send_uploads_on_a_miss_then_reuses_the_url(self):
+        path = os.path.join(tempfile.mkdtemp(prefix="blitzdex-art-"), "C_card.png")
+        with open(path, 'wb') as f: f.write(b"not really a png")
+        sent = []
+        async def send(embed, file=None, **kwargs):
+            sent.append((embed.image.url, file))
+            return message_with_image(self.url()) if file else None
+        original, bot.ATTACHMENT_URLS = bot.ATTACHMENT_URLS, self.cache
+        try:
+            await bot.send_card_art(send, bot.discord.Embed(), path)
+            await bot.send_card_art(send, bot.discord.Embed(), path)
+        finally: bot.ATTACHMENT_URLS = original
+        (first_url, first_file), (second_url, second_file) = sent
+        self.assertEqual(first_url, "attachment://C_card.png")
+        self.assertIsNotNone(first_file)
+        self.assertEqual((second_url, second_file), (self.url(), None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""The cluster protocol end to end: a coordinator serving a temp Unix socket and one worker's ClusterClient, with the
+worker's cached card counts dropped when the coordinator pushes a change.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="blitzdex-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import bot  # noqa: E402
+
+
+class ClusterProtocolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # The coordinator's side is this process's own store; the worker's side reaches it only through the socket
+        self.saved_store, bot.INVENTORY_STORE = bot.INVENTORY_STORE, bot.InventoryStore(bot.STORAGE)
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "cluster.sock")
+        self.server = await asyncio.start_unix_server(bot.serve_cluster_connection, path=path, limit=bot.CLUSTER_MESSAGE_LIMIT)
+        self.client = bot.ClusterClient(path)
+        self.store = bot.RemoteInventoryStore(self.client)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.server.close(); await self.server.wait_closed()
+        bot.INVENTORY_STORE = self.saved_store
+        self.tmp.cleanup()
+
+    async def test_add_inventory_remove_round_trip(self):
+        await self.store.add(1, "alice", "Foo", False, "Foo-1")
+        await self.store.add(1, "alice", "Bar", True, "Bar-1")
+        self.assertEqual([(c['name'], c['is_stolen'], c['unique_id']) for c in await self.store.get(1)], [("Foo", False, "Foo-1"), ("Bar", True, "Bar-1")])
+        self.assertEqual(await self.store.card_counts(1), {"Foo": [1, 0], "Bar": [0, 1]})
+
+        removed = await self.store.remove(1, "foo")
+        self.assertEqual((removed['card_name'], removed['unique_id']), ("Foo", "Foo-1"))
+        self.assertIsNone(await self.store.remove(1, "Foo"))
+        self.assertEqual([c['name'] for c in await self.store.get(1)], ["Bar"])
+        self.assertEqual((await self.store.names(1)).names, ["Bar"])
+        self.assertEqual(await self.store.get(2), [])
+
+    async def test_push_drops_cached_counts(self):
+        await self.store.add(1, "alice", "Foo", False, "Foo-1")
+        version = await self.store.version(1)
+        self.assertIn(1, self.store.summaries)
+        bot.CLUSTER_OPS["add"](1, "alice", "Bar", False, "Bar-1") # as if another worker had called it
+        await self.store.get(1) # the push is written ahead of this reply, so it has been read by now
+        self.assertNotIn(1, self.store.summaries)
+        self.assertEqual(set(await self.store.card_counts(1)), {"Foo", "Bar"})
+        self.assertGreater(await self.store.version(1), version)
+
+    async def test_coordinator_error_reaches_the_caller(self):
+        with self.assertRaisesRegex(RuntimeError, "Coordinator failed 'no_such_op'"):
+            await self.client.call("no_such_op")
+        self.assertEqual(await self.store.get(1), []) # the connection survives the failed call
+
+
+if __name__ == "__main__":
+    unittest.main()